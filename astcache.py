@@ -0,0 +1,204 @@
+import os
+import sys
+import marshal
+import hashlib
+import functools
+import tempfile
+import myast
+
+"""
+On-disk cache of parsed programs.
+
+An entry holds the Program parsed from one source and is named by a hash of the source bytes and of
+the compiler version, so an entry can only ever be found for exactly the source and compiler that
+produced it. Entries are evicted least recently used first once the cache outgrows its size limit.
+An entry that fails to load (truncated, corrupt, or written by an incompatible compiler) is
+deleted and treated as a miss, so the caller re-parses and stores it again.
+"""
+
+MAGIC = b"CPAST\x01"
+DEFAULT_DIR = os.environ.get("CHOCOPY_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "chocopy2bril")
+DEFAULT_MAX_BYTES = 64 << 20
+
+def compiler_version() -> bytes:
+    """
+    Hash of the modules that turn source text into an AST, and of this one, so editing any of them
+    makes every existing entry unreachable.
+    """
+    digest = hashlib.sha256(sys.version.encode())
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ("lexer.py", "parser.py", "myast.py", "astcache.py"):
+        with open(os.path.join(here, name), "rb") as f:
+            digest.update(f.read())
+    return digest.digest()
+
+VERSION = compiler_version()
+
+@functools.cache
+def slot_names(cls) -> tuple[str]:
+    return tuple(name for klass in reversed(cls.__mro__) for name in getattr(klass, "__slots__", ()))
+
+def flatten(root) -> list[myast.Ast]:
+    """
+    Lists the nodes reachable from `root` (root last) so that every node comes after the nodes it
+    refers to: a pre-order walk visiting fields last to first, reversed. Walks with an explicit stack,
+    as expressions can be arbitrarily deep.
+    """
+    order, stack = [], [root]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, myast.Ast):
+            order.append(value)
+            stack.extend(getattr(value, name) for name in slot_names(type(value)))
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    order.reverse()
+    return order
+
+"""
+A program is stored as a marshalled list of node records in flatten() order. A record is
+(class name, tags, values): one value per slot of the class, encoded as its tag says:
+
+    "p"  a plain value (None, bool, int, str, or a list of those), stored as is
+    "o"  a myast.Op, stored by name
+    "n"  a node, stored as its index in the list
+    "l"  a list or tuple whose leaves are all nodes, stored with each node as its index
+
+Every index refers to an earlier record, so records are rebuilt in order without recursion.
+"""
+
+def encode_refs(value, index):
+    if isinstance(value, myast.Ast):
+        return index[id(value)]
+    assert isinstance(value, (list, tuple)), f"cannot store {value!r}"
+    return type(value)(encode_refs(item, index) for item in value)
+
+def decode_refs(value, nodes):
+    if isinstance(value, int):
+        return nodes[value]
+    return type(value)(decode_refs(item, nodes) for item in value)
+
+def encode_field(value, index):
+    if isinstance(value, myast.Ast):
+        return "n", index[id(value)]
+    if isinstance(value, myast.Op):
+        return "o", value.name
+    if isinstance(value, (list, tuple)) and value and not isinstance(value[0], (bool, int, str)):
+        return "l", encode_refs(value, index)
+    return "p", value
+
+def dump_program(program) -> bytes:
+    nodes = flatten(program)
+    index = {id(node) : i for i, node in enumerate(nodes)}
+    records = []
+    for node in nodes:
+        fields = [encode_field(getattr(node, name), index) for name in slot_names(type(node))]
+        records.append((type(node).__name__, sys.intern("".join(tag for tag, _ in fields)), tuple(value for _, value in fields)))
+    return marshal.dumps(records)
+
+def load_program(data) -> myast.Program:
+    nodes = []
+    layouts = {} # (class name, tags) -> (class, [(slot, tag)]) of the fields that need decoding
+    for class_name, tags, values in marshal.loads(data):
+        layout = layouts.get((class_name, tags))
+        if layout is None:
+            cls = getattr(myast, class_name)
+            if not (isinstance(cls, type) and issubclass(cls, myast.Ast) and len(tags) == len(slot_names(cls))):
+                raise Exception(f"bad record of {class_name}")
+            layout = layouts[class_name, tags] = cls, list(zip(slot_names(cls), tags))
+        cls, fields = layout
+        node = cls.__new__(cls)
+        for (name, tag), value in zip(fields, values):
+            if tag == "n":
+                value = nodes[value]
+            elif tag == "l":
+                value = decode_refs(value, nodes)
+            elif tag == "o":
+                value = myast.Op[value]
+            setattr(node, name, value)
+        nodes.append(node)
+    if not nodes or not isinstance(nodes[-1], myast.Program):
+        raise Exception("not a program")
+    return nodes[-1]
+
+class AstCache(object):
+    """
+    Entries are files named <key>.ast holding MAGIC, the key, the SHA-256 of the payload and the
+    payload written by dump_program. An entry's modification time is its last use.
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, source) -> str:
+        """
+        Returns the key of `source`, a bytes-like object such as bytes or an mmap.
+        """
+        return hashlib.sha256(VERSION + hashlib.sha256(source).digest()).hexdigest()
+
+    def path(self, key) -> str:
+        return os.path.join(self.directory, key + ".ast")
+
+    def load(self, key) -> myast.Program | None:
+        """
+        Returns the program stored under `key`, or None if there is none or it cannot be loaded.
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        header = MAGIC + key.encode()
+        try:
+            if data[:len(header)] != header:
+                raise Exception("bad header")
+            checksum, payload = data[len(header):len(header)+32], data[len(header)+32:]
+            if hashlib.sha256(payload).digest() != checksum:
+                raise Exception("bad checksum")
+            program = load_program(payload)
+        except Exception:
+            self.remove(path)
+            return None
+
+        os.utime(path)
+        return program
+
+    def store(self, key, program):
+        """
+        Stores `program` under `key`, then evicts old entries if the cache is over its size limit.
+        """
+        payload = dump_program(program)
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + key.encode() + hashlib.sha256(payload).digest() + payload)
+        os.replace(tmp, self.path(key)) # readers only ever see whole entries
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes least recently used entries until the cache fits in `max_bytes`.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".ast"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            self.remove(path)
+            total -= size
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
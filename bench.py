@@ -0,0 +1,339 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import tracemalloc
+import cfg
+import opt
+import myast
+import astcache
+import interp
+from lexer import *
+from bril import Function
+from parser import Parser, compile_stream, get_cached_program
+from incremental import IncrementalParser
+
+def synthetic_program(num_funcs=20, num_stmts=20, line_terms=200, seed=0):
+    """
+    Generates a valid ChocoPy program made of `num_funcs` functions, each with `num_stmts`
+    statements whose right-hand sides are operator chains of `line_terms` terms, mimicking
+    machine-generated sources with very long lines.
+    """
+    rng = random.Random(seed)
+    ops = ["+", "-", "*", "//", "%"]
+    lines = []
+
+    def chain():
+        terms = [rng.choice(["a", "b", "x", "y", str(rng.randint(1, 99))])]
+        for _ in range(line_terms - 1):
+            term = rng.choice(["a", "b", "x", "y", str(rng.randint(1, 99)), "(x + 1)"])
+            terms.append(f"{rng.choice(ops)} {term}")
+        return " ".join(terms)
+
+    for f in range(num_funcs):
+        lines.append(f"def f{f}(a: int, b: int) -> int:")
+        lines.append("    x: int = 0")
+        lines.append("    y: int = 1")
+        for s in range(num_stmts):
+            kind = s % 4
+            if kind == 0:
+                lines.append(f"    x = {chain()}")
+            elif kind == 1:
+                lines.append(f"    while x < {chain()}:")
+                lines.append("        x = x + 1")
+            elif kind == 2:
+                lines.append(f"    if {chain()} == y:")
+                lines.append(f"        y = {chain()}")
+                lines.append("    else:")
+                lines.append("        y = y - 1 # comment")
+            else:
+                lines.append(f"    y = {chain()}")
+        lines.append("    return x + y")
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+def best_of(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_lexer():
+    """
+    Reports lexer throughput in MB/s on a program with long lines.
+    """
+    text = synthetic_program()
+    size = len(text.encode())
+    secs = best_of(lambda: sum(1 for _ in lex_text(text)))
+    print(f"lexer: {size / 1e6:.2f} MB in {secs:.3f} s = {size / 1e6 / secs:.2f} MB/s")
+
+def bench_parser():
+    """
+    Reports Parser.get_program throughput in tokens/s on pre-lexed programs with long and short lines.
+    """
+    for text in (synthetic_program(), synthetic_program(num_funcs=500, num_stmts=40, line_terms=5)):
+        tokens = TokenStream.from_text(text)
+        secs = best_of(lambda: Parser(tokens).get_program())
+        print(f"parser: {len(tokens)} tokens in {secs:.3f} s = {len(tokens) / secs / 1e3:.0f}k tokens/s")
+
+def bench_incremental():
+    """
+    Reports the time to apply a one-line edit to a program with many small functions,
+    incrementally and by re-lexing and re-parsing the whole source.
+    """
+    text = synthetic_program(num_funcs=2000, num_stmts=8, line_terms=6)
+    doc = IncrementalParser(text)
+    pos = text.index("    x = ", len(text) // 2) + len("    x = ")
+    edits = 100
+    start = time.perf_counter()
+    for i in range(edits):
+        doc.edit(pos, pos + 1, "y" if i % 2 == 0 else "x")
+    secs = (time.perf_counter() - start) / edits
+    full = best_of(lambda: Parser(TokenStream.from_text(text)).get_program())
+    print(f"incremental: {len(text) / 1e6:.2f} MB, {len(doc.chunks)} chunks: {secs * 1e3:.3f} ms/edit vs {full * 1e3:.1f} ms full re-parse")
+
+def peak_memory(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+class NullOutput(object):
+    def write(self, s): pass
+
+def bench_stream():
+    """
+    Reports the peak memory of compiling a file whole and one function at a time, for programs with more
+    and more functions of the same size: the full compile grows with the program, the streaming one doesn't.
+    """
+    for num_funcs in (10, 100, 300):
+        text = synthetic_program(num_funcs=num_funcs, num_stmts=8, line_terms=20)
+        full = peak_memory(lambda: NullOutput().write(json.dumps(Parser(TokenStream.from_text(text)).get_program().get_bril(), indent=4)))
+        stream = peak_memory(lambda: compile_stream(text, NullOutput()))
+        print(f"stream: {num_funcs} functions, {len(text) / 1e6:.2f} MB: peak {full / 1e6:.1f} MB whole vs {stream / 1e6:.2f} MB streaming")
+
+def bench_cache():
+    """
+    Reports the time to get a program from the AST cache on a miss (parse and store) and on a hit,
+    against lexing and parsing it.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        for text in (synthetic_program(), synthetic_program(num_funcs=500, num_stmts=40, line_terms=5)):
+            cache = astcache.AstCache(directory)
+            parse = best_of(lambda: Parser(TokenStream.from_text(text)).get_program())
+
+            def miss():
+                get_cached_program(text, cache)
+                cache.remove(cache.path(cache.key(text.encode())))
+
+            miss = best_of(miss)
+            get_cached_program(text, cache)
+            hit = best_of(lambda: get_cached_program(text, cache))
+            print(f"cache: {len(text) / 1e6:.2f} MB: parse {parse:.3f} s, miss {miss:.3f} s, hit {hit:.3f} s")
+
+def bench_types():
+    """
+    Reports the time to type-check and generate code for a single assignment whose right-hand side
+    is an operator chain of n terms. Time per term should stay flat as n grows.
+    """
+    for n in (2000, 4000, 8000, 16000, 32000):
+        chain = " + ".join(["x", "(x * 2)", "x // 3", "1"] * (n // 4))
+        program = Parser(TokenStream.from_text(f"def f(x: int) -> int:\n    x = {chain}\n    return x\n")).get_program()
+        secs = best_of(lambda: program.get_bril())
+        print(f"types: {n} terms in {secs * 1e3:.1f} ms = {secs / n * 1e6:.2f} us/term")
+
+def nested_program(depth=150, num_stmts=2000):
+    """
+    Generates a function whose statements sit inside `depth` nested if/while blocks.
+    """
+    lines = ["def f(a: int, b: int) -> int:", "    x: int = 0"]
+    for d in range(depth):
+        indent = "    " * (d + 1)
+        lines.append(f"{indent}{'if' if d % 2 else 'while'} x < {d + 1}:")
+    indent = "    " * (depth + 1)
+    lines += [f"{indent}x = x + a * {s} - b // 3" for s in range(num_stmts)]
+    lines.append("    return x")
+    return "\n".join(lines) + "\n"
+
+def bench_codegen():
+    """
+    Reports the time and peak memory of generating Bril JSON from a type-checked program, for
+    programs with long lines, many short statements, and deeply nested blocks.
+    """
+    for text in (synthetic_program(), synthetic_program(num_funcs=500, num_stmts=40, line_terms=5), nested_program()):
+        program = Parser(TokenStream.from_text(text)).get_program()
+        program.get_bril() # type-checks
+        codegen = lambda: [func_def.get_bril() for func_def in program.func_defs]
+        secs = best_of(codegen)
+        peak = peak_memory(codegen)
+        print(f"codegen: {len(text) / 1e6:.2f} MB in {secs:.3f} s, peak {peak / 1e6:.1f} MB")
+
+"""
+Arguments of @main the example programs are run with, as in the examples' own comments.
+"""
+EXAMPLE_ARGS = {"catalan" : [10], "collatz" : [27], "fermat_factor" : [5959], "gcd" : [1071, 462, 1], "isqrt" : [1000, 1],
+                "primes" : [60], "quadratic" : [1, -4, -21], "relative_primes" : [30]}
+
+def example_programs():
+    """
+    Yields the name and parsed program of each example in EXAMPLE_ARGS.
+    """
+    for name in EXAMPLE_ARGS:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples", f"{name}.py")) as f:
+            yield name, Parser(TokenStream.from_text(f)).get_program()
+
+def count_instrs(bril) -> int:
+    return sum(1 for func in bril["functions"] for instr in func["instrs"] if "op" in instr)
+
+def bench_fold():
+    """
+    Reports the instructions constant folding saves: executed, on the examples, and generated, on a
+    program with long lines.
+    """
+    for name, program in example_programs():
+        plain = interp.run(program.get_bril(fold=False), EXAMPLE_ARGS[name])
+        folded = interp.run(program.get_bril(), EXAMPLE_ARGS[name])
+        assert folded.output == plain.output
+        print(f"fold: {name}: {plain.instrs} -> {folded.instrs} instructions executed")
+    program = Parser(TokenStream.from_text(synthetic_program())).get_program()
+    print(f"fold: synthetic: {count_instrs(program.get_bril(fold=False))} -> {count_instrs(program.get_bril())} instructions generated")
+
+def bench_opt():
+    """
+    Reports the instructions the passes of opt.PIPELINE save when the examples run, and the time they
+    take on a program with long lines.
+    """
+    for name, program in example_programs():
+        plain = interp.run(program.get_bril(), EXAMPLE_ARGS[name])
+        optimized = interp.run(program.get_bril(passes=opt.PIPELINE), EXAMPLE_ARGS[name])
+        assert optimized.output == plain.output
+        print(f"opt: {name}: {plain.instrs} -> {optimized.instrs} instructions executed")
+    program = Parser(TokenStream.from_text(synthetic_program())).get_program()
+    program.get_bril() # type-checks
+    plain = best_of(lambda: [func_def.get_bril() for func_def in program.func_defs])
+    optimized = best_of(lambda: [func_def.get_bril(passes=opt.PIPELINE) for func_def in program.func_defs])
+    print(f"opt: synthetic: codegen {plain:.3f} s, with passes {optimized:.3f} s")
+
+def bench_cfg():
+    """
+    Reports the time to compute the dominator tree, dominance frontiers and natural loops of a function
+    with many blocks, and to get them again after a pass that leaves its CFG as it is.
+    """
+    text = synthetic_program(num_funcs=1, num_stmts=4000, line_terms=3)
+    func = Function.from_bril(Parser(TokenStream.from_text(text)).get_program().get_bril()["functions"][0])
+
+    def analyses():
+        analysis = cfg.analyze(func)
+        analysis.dom_tree(), analysis.frontier(), analysis.loops()
+
+    def fresh():
+        func.analysis = None
+        analyses()
+
+    secs = best_of(fresh)
+    opt.local_value_numbering(func)
+    cached = best_of(analyses)
+    blocks = len(cfg.basic_blocks(func.instrs))
+    print(f"cfg: {blocks} blocks: analyses {secs * 1e3:.1f} ms, after a pass keeping the CFG {cached * 1e3:.1f} ms")
+
+def bench_ssa():
+    """
+    Reports the cost of a round trip through SSA form after opt.PIPELINE on the examples: the phis
+    to_ssa places, the copies from_ssa turns them into and how many are left once it merges variables,
+    and the instructions executed before the round trip and after it, without merging and with.
+    """
+    for name, program in example_programs():
+        optimized = program.get_bril(passes=opt.PIPELINE)
+        ssa = opt.optimize_bril(optimized, [opt.to_ssa])
+        phis = sum(1 for func in ssa["functions"] for instr in func["instrs"] if instr.get("op") == "phi")
+        copied = opt.optimize_bril(ssa, [lambda func: opt.from_ssa(func, merge=False)])
+        merged = opt.optimize_bril(ssa, [opt.from_ssa])
+        copies = [count_instrs(bril) - count_instrs(ssa) + phis for bril in (copied, merged)]
+        runs = [interp.run(bril, EXAMPLE_ARGS[name]) for bril in (optimized, copied, merged)]
+        assert all(run.output == runs[0].output for run in runs)
+        print(f"ssa: {name}: {phis} phis -> {copies[0]} copies, {copies[1]} after merging; {runs[0].instrs} -> {runs[1].instrs} instructions executed, {runs[2].instrs} after merging")
+
+def bench_inline():
+    """
+    Reports what inlining does on the examples, before opt.PIPELINE: the calls and instructions executed
+    without it and with it, and the instructions generated.
+    """
+    for name, program in example_programs():
+        optimized = program.get_bril(passes=opt.PIPELINE)
+        inlined = program.get_bril(passes=opt.PIPELINE, inlined=[])
+        runs = [interp.run(bril, EXAMPLE_ARGS[name]) for bril in (optimized, inlined)]
+        assert runs[1].output == runs[0].output
+        print(f"inline: {name}: {runs[0].calls} -> {runs[1].calls} calls, {runs[0].instrs} -> {runs[1].instrs} instructions executed, "
+              f"{count_instrs(optimized)} -> {count_instrs(inlined)} generated")
+
+def loop_program(seed=0, num_loops=12):
+    """
+    Generates a program of for loops with random trip counts and bodies of a few statements, some of
+    them reading the loop's counter and some nested loops.
+    """
+    rng = random.Random(seed)
+    lines = ["def f(a: int) -> int:", "    s: int = 0", "    t: int = 0"]
+    for n in range(num_loops):
+        bounds = rng.choice([f"{rng.randint(1, 12)}", f"{rng.randint(0, 5)}, {rng.randint(20, 400)}"])
+        lines.append(f"    for i in range({bounds}):")
+        if n % 3 == 2:
+            lines.append(f"        for j in range({rng.randint(2, 9)}):")
+            lines.append(f"            t = t + i * j - a")
+        for _ in range(rng.randint(1, 3 + n % 4)):
+            lines.append(f"        {rng.choice(['s', 't'])} = {rng.choice(['s', 't'])} {rng.choice(['+', '-'])} {rng.choice(['i', 'a', 'i * a', str(n + 1)])} % 1000")
+    lines += ["    return s + t", "def main(a: int):", "    print(f(a))"]
+    return "\n".join(lines) + "\n"
+
+def bench_unroll():
+    """
+    Reports what unrolling for loops does on a program of loops, before opt.PIPELINE and after it: the
+    instructions executed and generated, and how each loop was unrolled.
+    """
+    program = Parser(TokenStream.from_text(loop_program())).get_program()
+    for passes in ((), opt.PIPELINE):
+        unrolling = myast.Unrolling()
+        plain, unrolled = program.get_bril(passes=passes), program.get_bril(passes=passes, unrolling=unrolling)
+        runs = [interp.run(bril, [7]) for bril in (plain, unrolled)]
+        assert runs[1].output == runs[0].output
+        print(f"unroll: {'pipeline' if passes else 'no passes'}: {runs[0].instrs} -> {runs[1].instrs} instructions executed, "
+              f"{count_instrs(plain)} -> {count_instrs(unrolled)} generated")
+    for record in unrolling.loops.values():
+        print(f"unroll: {record.report()}")
+
+def ast_nodes(root):
+    """
+    Yields every AST node reachable from `root`, looking through lists and tuples of nodes.
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (list, tuple)):
+            stack.extend(node)
+        elif isinstance(node, myast.Ast):
+            yield node
+            stack.extend(getattr(node, field) for cls in type(node).__mro__ for field in getattr(cls, "__slots__", ()))
+
+def bench_ast():
+    """
+    Reports the memory an AST holds, in bytes per node, counting the nodes and the lists inside them.
+    """
+    for text in (synthetic_program(), synthetic_program(num_funcs=500, num_stmts=40, line_terms=5)):
+        tokens = TokenStream.from_text(text)
+        tracemalloc.start()
+        program = Parser(tokens).get_program()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        nodes = sum(1 for _ in ast_nodes(program))
+        print(f"ast: {nodes} nodes in {size / 1e6:.1f} MB = {size / nodes:.1f} bytes/node")
+
+BENCHMARKS = {"lexer" : bench_lexer, "parser" : bench_parser, "incremental" : bench_incremental, "stream" : bench_stream, "ast" : bench_ast, "cache" : bench_cache, "types" : bench_types, "codegen" : bench_codegen, "fold" : bench_fold, "opt" : bench_opt, "cfg" : bench_cfg, "ssa" : bench_ssa, "inline" : bench_inline, "unroll" : bench_unroll}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
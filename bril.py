@@ -0,0 +1,130 @@
+"""
+Compact in-memory Bril: instructions are __slots__ records, turned into Bril JSON dicts only when a
+function is serialized.
+"""
+
+class Instr(object):
+    """
+    A Bril instruction. Fields a given op doesn't use are None; `value` is only used by "const".
+    """
+
+    __slots__ = ("op", "dest", "type", "args", "funcs", "labels", "value")
+
+    def __init__(self, op, dest=None, type=None, args=None, funcs=None, labels=None, value=None):
+        self.op = op
+        self.dest = dest
+        self.type = type
+        self.args = args
+        self.funcs = funcs
+        self.labels = labels
+        self.value = value
+
+    def __repr__(self):
+        return f"Instr({self.to_bril()})"
+
+    def to_bril(self) -> dict:
+        if self.funcs is None and self.labels is None and self.dest is not None: # the common cases
+            if self.op == "const":
+                return {"dest" : self.dest, "op" : "const", "type" : self.type, "value" : self.value}
+            return {"dest" : self.dest, "op" : self.op, "type" : self.type, "args" : self.args}
+        instr = {}
+        if self.dest is not None: instr["dest"] = self.dest
+        instr["op"] = self.op
+        if self.type is not None: instr["type"] = self.type
+        if self.funcs is not None: instr["funcs"] = self.funcs
+        if self.labels is not None: instr["labels"] = self.labels
+        if self.args is not None: instr["args"] = self.args
+        if self.op == "const": instr["value"] = self.value
+        return instr
+
+class Label(object):
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"Label({self.name})"
+
+    def to_bril(self) -> dict:
+        return {"label" : self.name}
+
+class FunctionBuilder(object):
+    """
+    Collects the body of one function. Code generation appends to a single builder, so nothing is
+    copied as blocks nest, and hands out fresh register and label names.
+    """
+
+    __slots__ = ("instrs", "reg", "label", "fold", "unrolling")
+
+    def __init__(self, fold=True, unrolling=None):
+        self.instrs = []
+        self.reg = 1
+        self.label = 1
+        self.fold = fold # whether expressions are constant-folded before they are emitted
+        self.unrolling = unrolling # how for loops are unrolled (see myast.Unrolling), None to emit them as they are
+
+    def next_reg(self) -> str:
+        reg = f"v{self.reg}"
+        self.reg += 1
+        return reg
+
+    def next_label(self) -> str:
+        label = self.label
+        self.label += 1
+        return str(label)
+
+    def add(self, op, dest=None, type=None, args=None, funcs=None, labels=None, value=None) -> Instr:
+        instr = Instr(op, dest, type, args, funcs, labels, value)
+        self.instrs.append(instr)
+        return instr
+
+    def add_label(self, name):
+        self.instrs.append(Label(name))
+
+    def terminated(self) -> bool:
+        """
+        Returns True if the last instruction added leaves its block, so that what is added next is only
+        reached by a jump to a label.
+        """
+        return bool(self.instrs) and isinstance(self.instrs[-1], Instr) and self.instrs[-1].op in ("jmp", "br", "ret")
+
+class Function(object):
+    """
+    A function as the optimization passes see it: its signature, as in Bril JSON, and its body as
+    Instr and Label records.
+    """
+
+    __slots__ = ("name", "args", "type", "instrs", "analysis")
+
+    def __init__(self, name, args, type, instrs):
+        self.name = name
+        self.args = args # [{"name" : ..., "type" : ...}]
+        self.type = type # None if the function returns nothing
+        self.instrs = instrs
+        self.analysis = None # control-flow analyses of the last CFG analyzed, see cfg.analyze
+
+    def __repr__(self):
+        return f"Function({self.name})"
+
+    def params(self) -> list[str]:
+        return [arg["name"] for arg in self.args]
+
+    def to_bril(self) -> dict:
+        func = {"name" : self.name, "instrs" : [instr.to_bril() for instr in self.instrs]}
+        if self.type: func["type"] = self.type
+        if self.args: func["args"] = self.args
+        return func
+
+    @classmethod
+    def from_bril(cls, func) -> "Function":
+        return cls(func["name"], func.get("args", []), func.get("type"), [from_bril(instr) for instr in func["instrs"]])
+
+def from_bril(instr) -> Instr | Label:
+    """
+    Returns the record of `instr`, an instruction or label in Bril JSON.
+    """
+    if "label" in instr:
+        return Label(instr["label"])
+    return Instr(instr["op"], instr.get("dest"), instr.get("type"), instr.get("args"), instr.get("funcs"), instr.get("labels"), instr.get("value"))
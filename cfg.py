@@ -0,0 +1,326 @@
+import sys
+import json
+import collections
+from bril import Instr, Label, Function
+
+"""
+Basic blocks and the control-flow graph of one function's instructions (see bril.FunctionBuilder),
+and analyses of it: liveness, dominators, the dominance frontier and natural loops.
+
+A block starts at a label or after a terminator, and ends at a terminator or before a label. A block
+without a terminator falls through to the next one. Blocks that do not start at a label have
+generated names, which are never emitted, so nothing can jump to them.
+"""
+
+TERMINATORS = {"jmp", "br", "ret"}
+
+class Block(object):
+
+    __slots__ = ("name", "label", "instrs", "succs", "preds")
+
+    def __init__(self, name, label=None):
+        self.name = name
+        self.label = label # the Label the block starts at, or None
+        self.instrs = [] # the block's Instrs, without its label
+        self.succs = [] # the blocks control can pass to next, and come from
+        self.preds = []
+
+    def __repr__(self):
+        return f"Block({self.name})"
+
+    def terminator(self) -> Instr | None:
+        if self.instrs and self.instrs[-1].op in TERMINATORS:
+            return self.instrs[-1]
+        return None
+
+def basic_blocks(instrs) -> list[Block]:
+    """
+    Splits a function's instructions into blocks, in order, and links each block to its successors
+    and predecessors. The first block is the entry.
+    """
+    blocks = []
+    block = None
+    for instr in instrs:
+        if isinstance(instr, Label):
+            block = Block(instr.name, instr)
+            blocks.append(block)
+            continue
+        if block is None:
+            block = Block(f"b{len(blocks)}")
+            blocks.append(block)
+        block.instrs.append(instr)
+        if instr.op in TERMINATORS:
+            block = None
+    if not blocks:
+        blocks.append(Block("b0"))
+
+    by_label = {block.label.name : block for block in blocks if block.label}
+    for i, block in enumerate(blocks):
+        terminator = block.terminator()
+        if terminator is None:
+            block.succs = blocks[i+1:i+2]
+        elif terminator.op != "ret":
+            block.succs = [by_label[label] for label in terminator.labels]
+        for succ in block.succs:
+            succ.preds.append(block)
+    return blocks
+
+def flatten(blocks) -> list[Instr | Label]:
+    """
+    Returns the instructions of `blocks`, in order, with their labels.
+    """
+    instrs = []
+    for block in blocks:
+        if block.label: instrs.append(block.label)
+        instrs += block.instrs
+    return instrs
+
+def reachable(blocks) -> list[Block]:
+    """
+    Returns the blocks control can reach from the entry, in order.
+    """
+    seen, stack = {blocks[0]}, [blocks[0]]
+    while stack:
+        for succ in stack.pop().succs:
+            if succ not in seen:
+                seen.add(succ)
+                stack.append(succ)
+    return [block for block in blocks if block in seen]
+
+def liveness(blocks) -> tuple[dict[Block, set[str]], dict[Block, set[str]]]:
+    """
+    Returns the variables live into and out of each block: read on some path from the start or end of
+    the block before being written. Solves the backward dataflow problem with a worklist. A phi's
+    arguments count as read in its block.
+    """
+    reads, writes = {}, {}
+    for block in blocks:
+        read, written = set(), set()
+        for instr in block.instrs:
+            read.update(arg for arg in instr.args or () if arg not in written)
+            if instr.dest is not None: written.add(instr.dest)
+        reads[block], writes[block] = read, written
+
+    live_in = {block : set() for block in blocks}
+    live_out = {block : set() for block in blocks}
+    worklist = collections.deque(reversed(blocks))
+    queued = set(blocks)
+    while worklist:
+        block = worklist.popleft()
+        queued.discard(block)
+        live_out[block] = set().union(*(live_in[succ] for succ in block.succs))
+        new_in = reads[block] | (live_out[block] - writes[block])
+        if new_in != live_in[block]:
+            live_in[block] = new_in
+            for pred in block.preds:
+                if pred not in queued:
+                    worklist.append(pred)
+                    queued.add(pred)
+    return live_in, live_out
+
+"""
+Dominance and loops.
+
+These depend only on the shape of the CFG, its block names and edges, not on the instructions in the
+blocks, so analyze() keeps them on the function and hands them out again until a pass changes the
+shape: passes that only rewrite instructions never cause them to be recomputed.
+"""
+
+class Loop(object):
+
+    __slots__ = ("header", "body", "latches")
+
+    def __init__(self, header, body, latches):
+        self.header = header # name of the block every path into the loop enters through
+        self.body = body # names of the blocks in the loop, the header included
+        self.latches = latches # names of the blocks with a back edge to the header
+
+    def __repr__(self):
+        return f"Loop(header={self.header}, body={sorted(self.body)})"
+
+    def exits(self, analysis) -> set[str]:
+        """
+        Returns the names of the blocks outside the loop that a block in the loop branches to.
+        """
+        return {succ for name in self.body for succ in analysis.succs[name] if succ not in self.body}
+
+class Analysis(object):
+    """
+    Control-flow analyses of one CFG shape, by block name, each computed the first time it is asked for.
+    Blocks not reachable from the entry have no dominators, are in no dominance frontier and in no loop.
+    """
+
+    __slots__ = ("shape", "entry", "succs", "preds", "_order", "_idom", "_dom_tree", "_intervals", "_frontier", "_loops")
+
+    def __init__(self, shape):
+        self.shape = shape # ((name, (successor names...)), ...) of every block, in order
+        self.entry = shape[0][0]
+        self.succs = {name : succs for name, succs in shape}
+        self.preds = {name : [] for name, _ in shape}
+        for name, succs in shape:
+            for succ in succs:
+                self.preds[succ].append(name)
+        self._order = self._idom = self._dom_tree = self._intervals = self._frontier = self._loops = None
+
+    def order(self) -> list[str]:
+        """
+        Returns the reachable blocks in reverse postorder: every block before its successors, except along back edges.
+        """
+        if self._order is None:
+            postorder, seen = [], {self.entry}
+            stack = [(self.entry, iter(self.succs[self.entry]))]
+            while stack:
+                name, succs = stack[-1]
+                succ = next(succs, None)
+                if succ is None:
+                    postorder.append(name)
+                    stack.pop()
+                elif succ not in seen:
+                    seen.add(succ)
+                    stack.append((succ, iter(self.succs[succ])))
+            self._order = postorder[::-1]
+        return self._order
+
+    def idom(self) -> dict[str, str | None]:
+        """
+        Returns the immediate dominator of each reachable block (None for the entry), by the iterative
+        algorithm of Cooper, Harvey and Kennedy.
+        """
+        if self._idom is None:
+            order = self.order()
+            index = {name : i for i, name in enumerate(order)}
+            idom = {self.entry : self.entry}
+
+            def intersect(a, b):
+                while a != b:
+                    while index[a] > index[b]: a = idom[a]
+                    while index[b] > index[a]: b = idom[b]
+                return a
+
+            changed = True
+            while changed:
+                changed = False
+                for name in order[1:]:
+                    new = None
+                    for pred in self.preds[name]:
+                        if pred in idom:
+                            new = pred if new is None else intersect(pred, new)
+                    if idom.get(name) != new:
+                        idom[name] = new
+                        changed = True
+            idom[self.entry] = None
+            self._idom = idom
+        return self._idom
+
+    def dominators(self, name) -> list[str]:
+        """
+        Returns the blocks that dominate block `name`, from the block itself up to the entry.
+        """
+        idom = self.idom()
+        doms = []
+        while name is not None:
+            doms.append(name)
+            name = idom[name]
+        return doms
+
+    def dominates(self, a, b) -> bool:
+        """
+        Returns True if block `a` dominates block `b`, both reachable: if `b` is in `a`'s subtree of the
+        dominator tree, whose blocks are numbered consecutively in a depth-first walk.
+        """
+        if self._intervals is None:
+            tree, intervals, count = self.dom_tree(), {}, 0
+            stack = [(self.entry, False)]
+            while stack:
+                name, done = stack.pop()
+                if done:
+                    intervals[name] = (intervals[name], count)
+                    continue
+                intervals[name] = count
+                count += 1
+                stack.append((name, True))
+                stack.extend((child, False) for child in tree[name])
+            self._intervals = intervals
+        (a_first, a_end), (b_first, _) = self._intervals[a], self._intervals[b]
+        return a_first <= b_first < a_end
+
+    def dom_tree(self) -> dict[str, list[str]]:
+        """
+        Returns the children of each reachable block in the dominator tree, in reverse postorder.
+        """
+        if self._dom_tree is None:
+            tree = {name : [] for name in self.order()}
+            for name in self.order()[1:]:
+                tree[self.idom()[name]].append(name)
+            self._dom_tree = tree
+        return self._dom_tree
+
+    def frontier(self) -> dict[str, set[str]]:
+        """
+        Returns the dominance frontier of each reachable block: the blocks it does not strictly
+        dominate but dominates a predecessor of.
+        """
+        if self._frontier is None:
+            idom = self.idom()
+            frontier = {name : set() for name in self.order()}
+            for name in self.order():
+                preds = [pred for pred in self.preds[name] if pred in idom]
+                if len(preds) < 2: continue
+                for pred in preds:
+                    runner = pred
+                    while runner != idom[name]:
+                        frontier[runner].add(name)
+                        runner = idom[runner]
+            self._frontier = frontier
+        return self._frontier
+
+    def loops(self) -> list[Loop]:
+        """
+        Returns the natural loops, innermost first. Back edges to the same header make up one loop.
+        """
+        if self._loops is None:
+            idom = self.idom()
+            latches = collections.defaultdict(list)
+            for name in self.order():
+                for succ in self.succs[name]:
+                    if self.dominates(succ, name):
+                        latches[succ].append(name)
+            loops = []
+            for header, tails in latches.items():
+                body, stack = {header}, list(tails)
+                while stack:
+                    name = stack.pop()
+                    if name in body: continue
+                    body.add(name)
+                    stack.extend(pred for pred in self.preds[name] if pred in idom)
+                loops.append(Loop(header, body, tails))
+            loops.sort(key=lambda loop: len(loop.body))
+            self._loops = loops
+        return self._loops
+
+def shape(blocks) -> tuple:
+    return tuple((block.name, tuple(succ.name for succ in block.succs)) for block in blocks)
+
+def analyze(func, blocks=None) -> Analysis:
+    """
+    Returns the control-flow analyses of `func`, whose blocks are `blocks` if they are at hand, reusing
+    those made for an earlier version of the function if its CFG has the same shape.
+    """
+    if blocks is None: blocks = basic_blocks(func.instrs)
+    current = shape(blocks)
+    if func.analysis is None or func.analysis.shape != current:
+        func.analysis = Analysis(current)
+    return func.analysis
+
+if __name__ == "__main__":
+    # usage: cfg.py < program.json; prints each function's CFG, dominator tree, frontiers and loops
+    for func in json.load(sys.stdin)["functions"]:
+        analysis = analyze(Function.from_bril(func))
+        print(f"@{func['name']}")
+        for name, succs in analysis.shape:
+            unreachable = "" if name in analysis.idom() else " (unreachable)"
+            print(f"  {name} -> {' '.join(succs) or '(exit)'}{unreachable}")
+        for name in analysis.order():
+            print(f"  idom({name}) = {analysis.idom()[name]}, frontier = {sorted(analysis.frontier()[name])}")
+        for loop in analysis.loops():
+            print(f"  loop at {loop.header}: {sorted(loop.body)}, exits {sorted(loop.exits(analysis))}")
@@ -0,0 +1,162 @@
+import bisect
+import myast
+from lexer import *
+from parser import Parser
+
+"""
+Incremental re-lexing and re-parsing of an edited source.
+
+The source is kept as its top-level chunks (see lexer.source_chunks). Each chunk lexes on its own to
+exactly its slice of the whole token stream and parses to its FuncDef, so an edit only re-lexes and
+re-parses the chunks it touches; every other chunk keeps its tokens and FuncDef node.
+"""
+
+def split_chunks(text) -> list[str]:
+    """
+    Splits `text` into chunk texts whose concatenation is `text`. The first chunk always starts at 0.
+    """
+    return [chunk_text for chunk_text, _, _ in source_chunks(text)] or [""]
+
+class Chunk(object):
+
+    __slots__ = ("text", "start", "line", "nlines", "dead", "tokens", "lexed_at", "func_defs", "def_lines", "stop", "lex_error", "parse_error", "error_at_end")
+
+    def __init__(self, text, start, line):
+        self.text = text
+        self.start = start # offset of the chunk in the whole source
+        self.line = line # number of lines before the chunk
+        self.nlines = text.count("\n")
+        self.dead = text.startswith("#!#") # nothing at or after a '#!#' line is lexed
+        self.tokens = TokenStream()
+        self.lexed_at = (line, start) # positions in `tokens` are relative to where the chunk was when lexed
+        self.func_defs = []
+        self.def_lines = [] # FuncDef.line of each of `func_defs` when lexed at `lexed_at`
+        self.stop = False # true if parsing the whole source would stop in this chunk
+        self.lex_error = None
+        self.parse_error = None
+        self.error_at_end = False # true if the parse error is at the end of the chunk's tokens
+        if self.dead:
+            return
+
+        try:
+            self.tokens = TokenStream.from_text(text, line, start)
+        except AssertionError as e:
+            self.lex_error = e
+            return
+
+        parser = Parser(self.tokens)
+        try:
+            self.func_defs = parser.get_func_defs()
+            self.def_lines = [func_def.line for func_def in self.func_defs]
+            self.stop = parser.not_done()
+        except Exception as e:
+            self.parse_error = e
+            self.error_at_end = not parser.not_done()
+
+class IncrementalParser(object):
+    """
+    Keeps the token stream and AST of a source up to date under edits (see module docstring).
+    """
+
+    def __init__(self, text):
+        self.chunks = []
+        self.starts = [] # self.starts[i] == self.chunks[i].start, for bisection
+        start = line = 0
+        for chunk_text in split_chunks(text):
+            chunk = Chunk(chunk_text, start, line)
+            self.chunks.append(chunk)
+            self.starts.append(start)
+            start += len(chunk_text)
+            line += chunk.nlines
+
+    @property
+    def text(self) -> str:
+        return "".join(chunk.text for chunk in self.chunks)
+
+    def live_chunks(self) -> list[Chunk]:
+        """
+        Returns the chunks before the first '#!#' line.
+        """
+        live = []
+        for chunk in self.chunks:
+            if chunk.dead: break
+            live.append(chunk)
+        return live
+
+    def tokens(self) -> TokenStream:
+        """
+        Returns the token stream of the whole source, as TokenStream.from_text would produce it.
+        """
+        live = self.live_chunks()
+        for chunk in live:
+            if chunk.lex_error: raise chunk.lex_error
+        stream = TokenStream()
+        for chunk in live:
+            stream.extend(chunk.tokens, chunk.line - chunk.lexed_at[0], chunk.start - chunk.lexed_at[1])
+        return stream
+
+    def get_program(self) -> myast.Program:
+        """
+        Returns the program, as Parser.get_program would parse it, reusing the FuncDef nodes of every chunk.
+        """
+        live = self.live_chunks()
+        for chunk in live:
+            if chunk.lex_error: raise chunk.lex_error
+        func_defs = []
+        for k, chunk in enumerate(live):
+            if chunk.parse_error:
+                # re-parse with current positions so the error reports where the chunk is now; if the error
+                # is at the end of the chunk, the whole-source parser would have failed on the first token
+                # of the next chunk instead
+                tokens = TokenStream()
+                for c in live[k:k+2] if chunk.error_at_end else [chunk]:
+                    tokens.extend(c.tokens, c.line - c.lexed_at[0], c.start - c.lexed_at[1])
+                Parser(tokens).get_func_defs()
+                raise chunk.parse_error
+            for func_def, line in zip(chunk.func_defs, chunk.def_lines):
+                func_def.line = line + chunk.line - chunk.lexed_at[0] # positions in its body are relative to this
+            func_defs += chunk.func_defs
+            if chunk.stop: break
+        return myast.Program(func_defs)
+
+    def edit(self, start, end, replacement) -> myast.Program:
+        """
+        Replaces the source text in [start, end) with `replacement`, re-lexing and re-parsing only the
+        chunks the edit touches, and returns the updated program.
+        """
+        assert 0 <= start <= end <= self.starts[-1] + len(self.chunks[-1].text)
+
+        # first affected chunk; an edit to its first line can change whether that line starts a chunk,
+        # in which case it may merge into the chunk before it
+        i = bisect.bisect_right(self.starts, start) - 1
+        first_line_end = self.chunks[i].text.find("\n") + 1 or len(self.chunks[i].text)
+        if i > 0 and start < self.starts[i] + first_line_end:
+            i -= 1
+
+        # last affected chunk; one that begins right at `end` may lose the newline in front of it
+        j = bisect.bisect_right(self.starts, end) - 1
+
+        old_text = "".join(chunk.text for chunk in self.chunks[i:j+1])
+        region_start = self.starts[i]
+        new_text = old_text[:start - region_start] + replacement + old_text[end - region_start:]
+
+        new_chunks = []
+        offset, line = region_start, self.chunks[i].line
+        for chunk_text in split_chunks(new_text):
+            if not chunk_text: continue
+            chunk = Chunk(chunk_text, offset, line)
+            new_chunks.append(chunk)
+            offset += len(chunk_text)
+            line += chunk.nlines
+        if not new_chunks and len(self.chunks) == j - i + 1:
+            new_chunks.append(Chunk("", 0, 0)) # the whole source was deleted
+
+        offset_delta = len(new_text) - len(old_text)
+        line_delta = line - (self.chunks[j].line + self.chunks[j].nlines)
+        for chunk in self.chunks[j+1:]:
+            chunk.start += offset_delta
+            chunk.line += line_delta
+
+        self.chunks[i:j+1] = new_chunks
+        self.starts[i:] = [chunk.start for chunk in self.chunks[i:]]
+        return self.get_program()
@@ -0,0 +1,129 @@
+import sys
+import json
+
+"""
+A reference interpreter for the Bril this compiler generates, used to check that generated and
+optimized code still computes the same output and to count the instructions it executes.
+
+Follows brili: ints are 64-bit and wrap, div truncates toward zero, and a program runs from @main
+with its arguments. Like `brili -p`, labels are not counted as executed instructions. Calls are run
+with an explicit stack of frames, so deep recursion in the program does not recurse here.
+"""
+
+def wrap(value) -> int:
+    return (value + 2**63) % 2**64 - 2**63
+
+def trunc_div(lhs, rhs) -> int:
+    if rhs == 0:
+        raise Exception("error: division by zero")
+    quotient = abs(lhs) // abs(rhs)
+    return wrap(quotient if (lhs < 0) == (rhs < 0) else -quotient)
+
+VALUE_OPS = {"add" : lambda a, b: wrap(a + b), "sub" : lambda a, b: wrap(a - b), "mul" : lambda a, b: wrap(a * b), "div" : trunc_div,
+             "eq" : lambda a, b: a == b, "lt" : lambda a, b: a < b, "gt" : lambda a, b: a > b, "le" : lambda a, b: a <= b, "ge" : lambda a, b: a >= b,
+             "and" : lambda a, b: a and b, "or" : lambda a, b: a or b, "not" : lambda a: not a, "id" : lambda a: a}
+
+def format_value(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+class Function(object):
+
+    __slots__ = ("name", "params", "instrs", "labels")
+
+    def __init__(self, func):
+        self.name = func["name"]
+        self.params = [arg["name"] for arg in func.get("args", [])]
+        self.instrs = func["instrs"]
+        self.labels = {instr["label"] : i for i, instr in enumerate(self.instrs) if "label" in instr}
+
+class Frame(object):
+
+    __slots__ = ("func", "env", "pc", "label", "prev_label", "phis", "dest")
+
+    def __init__(self, func, args, dest=None):
+        self.func = func
+        self.env = dict(zip(func.params, args))
+        self.pc = 0
+        self.label = None # label of the block being executed, and of the one before it, for phi
+        self.prev_label = None
+        self.phis = [] # (dest, value) of the phis read so far at the start of the block
+        self.dest = dest # where the caller wants the return value
+
+class Result(object):
+
+    __slots__ = ("output", "instrs", "calls")
+
+    def __init__(self):
+        self.output = [] # printed lines
+        self.instrs = 0 # dynamic instruction count, as `brili -p` reports it
+        self.calls = 0
+
+def run(program, args) -> Result:
+    """
+    Runs `program`, Bril JSON, from @main with the values `args` and returns what it printed and
+    how many instructions it executed. Raises an Exception if the program traps.
+    """
+    funcs = {func["name"] : Function(func) for func in program["functions"]}
+    result = Result()
+    frames = [Frame(funcs["main"], args)]
+    while frames:
+        frame = frames[-1]
+        instrs, env = frame.func.instrs, frame.env
+        if frame.pc == len(instrs): # falling off the end returns nothing
+            ret = None
+        else:
+            instr = instrs[frame.pc]
+            frame.pc += 1
+            if "label" in instr:
+                frame.prev_label, frame.label = frame.label, instr["label"]
+                continue
+            result.instrs += 1
+            op = instr["op"]
+            if op == "const":
+                env[instr["dest"]] = instr["value"]
+            elif op in VALUE_OPS:
+                env[instr["dest"]] = VALUE_OPS[op](*[env[arg] for arg in instr["args"]])
+            elif op == "br":
+                label = instr["labels"][0 if env[instr["args"][0]] else 1]
+                frame.pc = frame.func.labels[label]
+            elif op == "jmp":
+                frame.pc = frame.func.labels[instr["labels"][0]]
+            elif op == "print":
+                result.output.append(" ".join(format_value(env[arg]) for arg in instr["args"]))
+            elif op == "call":
+                result.calls += 1
+                frames.append(Frame(funcs[instr["funcs"][0]], [env[arg] for arg in instr.get("args", [])], instr.get("dest")))
+            elif op == "phi": # the phis of a block all read before any writes; an argument not set leaves dest unset
+                for arg, label in zip(instr["args"], instr["labels"]):
+                    if label == frame.prev_label:
+                        frame.phis.append((instr["dest"], env.get(arg)))
+                        break
+                else:
+                    raise Exception(f"error: phi in @{frame.func.name} has no argument for .{frame.prev_label}")
+                if frame.pc == len(instrs) or instrs[frame.pc].get("op") != "phi":
+                    for dest, value in frame.phis:
+                        if value is None: env.pop(dest, None)
+                        else: env[dest] = value
+                    frame.phis.clear()
+            elif op == "nop":
+                pass
+            elif op != "ret":
+                raise Exception(f"error: unknown op {op}")
+            if op != "ret":
+                continue
+            ret = env[instr["args"][0]] if instr.get("args") else None
+        frames.pop()
+        if frames and frame.dest is not None:
+            frames[-1].env[frame.dest] = ret
+    return result
+
+if __name__ == "__main__":
+    # usage: interp.py [-p] [args...] < program.json, like brili
+    args = [json.loads(arg) for arg in sys.argv[1:] if arg != "-p"]
+    result = run(json.load(sys.stdin), args)
+    for line in result.output:
+        print(line)
+    if "-p" in sys.argv:
+        print(f"total_dyn_inst: {result.instrs}", file=sys.stderr)
@@ -1,20 +1,27 @@
+import os
 import re
 import sys
 import json
+import mmap
+import textwrap
+from array import array
+from itertools import accumulate
+from sys import intern
 
 class TokenPattern(object):
 
-    def __init__(self, name, pattern, process):
+    def __init__(self, name, pattern, process, lexeme=None):
         self.name = name
         self.pattern = pattern
         self.process = process
+        self.lexeme = lexeme # the exact text matched, for patterns built with `exact`
 
     def __repr__(self):
         return f"TokenPattern({self.name}, '{self.pattern}')"
 
     @classmethod
     def exact(cls, name, lexeme, process=None):
-        return cls(name, re.escape(lexeme), process)
+        return cls(name, re.escape(lexeme), process, lexeme)
 
     @classmethod
     def regexp(cls, name, pattern, process=None):
@@ -24,18 +31,6 @@ class TokenPattern(object):
     def group(cls, name, token_patterns, process=None):
         return cls(name, "|".join(t.pattern for t in token_patterns), process)
 
-    def match(self, text):
-        return re.match(self.pattern, text) is not None
-
-    def lex_and_split(self, text):
-        m_obj = re.match(self.pattern, text)
-        if m_obj:
-            value = m_obj.group()
-            if self.process: value = self.process(value)
-            return value, text[m_obj.end():]
-        else:
-            return None
-
 class Token(object):
 
     PRECEDENCE = { "OR" : 2,
@@ -81,6 +76,18 @@ class Token(object):
     LEXEMES_GROUP = [EQ, LE, GE, ARROW, NE, LT, GT, ADD, SUB, MUL, DIV, MOD, NOT, AND, OR, LPAREN, RPAREN, COLON, ASSIGN, COMMA]
     LEXEMES = TokenPattern.group("LEXEMES", LEXEMES_GROUP)
 
+    """
+    All terminals in the order they must be tried: the "exact match" lexemes first (longest
+    operators before their prefixes, e.g. '==' before '='), then BOOL, TYPE, KEYWORD, ID and NUM.
+    Python's alternation takes the first alternative that matches, so one compiled pattern with
+    a named group per terminal reproduces the order-sensitive cascade in a single `match` call.
+    """
+    SCAN_ORDER = LEXEMES_GROUP + [BOOL, TYPE, KEYWORD, ID, NUM]
+    SCANNER = re.compile(r"\s*(?:" + "|".join(f"(?P<{t.name}>{t.pattern})" for t in SCAN_ORDER) + ")")
+    PROCESS = {t.name : t.process for t in SCAN_ORDER if t.process}
+
+    __slots__ = ("name", "value")
+
     def __init__(self, name, value=None):
         self.name = name # token category
         self.value = value # token value (actual string); NEWLINE, INDENT and DEDENT tokens have value=None
@@ -113,129 +120,402 @@ class Token(object):
         return False
 
     @classmethod
-    def match(cls, text):
+    def scan(cls, text, pos=0, endpos=None):
+        """
+        Yields a (name, value, offset) triple for each token of `text[pos:endpos]` from left to right,
+        stopping at the end of the range or at the first position where no token can be matched.
+        A single precompiled alternation (`SCANNER`) is matched at an advancing index, so no
+        substrings are copied.
+        """
+        if endpos is None: endpos = len(text)
+        scanner = cls.SCANNER.match
+        process = cls.PROCESS
+        m_obj = scanner(text, pos, endpos)
+        while m_obj:
+            name = m_obj.lastgroup
+            value = m_obj.group(name)
+            if name in process: value = process[name](value)
+            yield name, value, m_obj.start(name)
+            m_obj = scanner(text, m_obj.end(), endpos)
 
+    @classmethod
+    def match(cls, text):
         """
         Given a string `text`, compute the first matching token of the text (if there is one),
         and return a pair consisting of (1) the matched token and (2) the remainder of `text`
         after the matched token. If no text remains, or no token can be matched, return None.
         """
-
-        if not text:
+        m_obj = cls.SCANNER.match(text)
+        if not m_obj:
             return None
-
-        text = text.lstrip()
-
-        """
-        Start by checking (in order!) if we match the following "exact match" terminals:
-
-            '==', # check before '='
-            '<=', # check before '<'
-            '>=', # check before '>'
-            '->', # check before '-'
-
-            '!=', '<', '>', '+', '-', '*', '//', '%', 'not', 'and', 'or', '(', ')', ':', '=', ','
-        """
-        if cls.LEXEMES.match(text):
-            for op in cls.LEXEMES_GROUP:
-                if op.match(text):
-                    value, text = op.lex_and_split(text)
-                    return Token(op.name, value), text
-
-        """
-        Check for BOOL terminal: 'True' | 'False'
-        """
-        if cls.BOOL.match(text):
-            value, text = cls.BOOL.lex_and_split(text)
-            return Token(cls.BOOL.name, value), text
-
-        """
-        Check for TYPE terminal: 'int' | 'bool'
-        """
-        if cls.TYPE.match(text):
-            value, text = cls.TYPE.lex_and_split(text)
-            return Token(cls.TYPE.name, value), text
-
-        """
-        Check for KEYWORD terminal: 'print' | 'def' | 'return' | 'pass' | 'if' | 'elif' | 'else' | 'while' | 'for' | 'in' | 'range'
-        """
-        if cls.KEYWORD.match(text):
-            value, text = cls.KEYWORD.lex_and_split(text)
-            return Token(cls.KEYWORD.name, value), text
-
-        """
-        Check for ID terminal: [a-zA-Z_][a-zA-Z_0-9]*
-        """
-        if cls.ID.match(text):
-            value, text = cls.ID.lex_and_split(text)
-            return Token(cls.ID.name, value), text
-
-        """
-        Check for NUM terminal: [0-9]+
-        """
-        if cls.NUM.match(text):
-            value, text = cls.NUM.lex_and_split(text)
-            return Token(cls.NUM.name, value), text
-
-        return None
-
-def lex_text(text):
+        name = m_obj.lastgroup
+        value = m_obj.group(name)
+        if name in cls.PROCESS: value = cls.PROCESS[name](value)
+        return Token(name, value), text[m_obj.end():]
+
+LINE_END = re.compile(r"[ \t]*(#.*)?\n") # first ignorable character on a line
+LEADING_SPACE = re.compile(r"[ ]*")
+
+def source_lines(source):
+    """
+    Yields the lines of `source` one at a time, each ending in a newline except possibly the last.
+    `source` may be a string, a text or binary file object, or an mmap; bytes are decoded as UTF-8.
+    Only one line is held at a time, so memory is bounded by the longest line, not the file size.
+    """
+    if isinstance(source, str):
+        pos = 0
+        while pos < len(source):
+            end = source.find("\n", pos) + 1 or len(source)
+            yield source[pos:end]
+            pos = end
+        return
+
+    lines = iter(source.readline, b"") if isinstance(source, mmap.mmap) else source
+    for line in lines:
+        yield line.decode() if isinstance(line, bytes) else line
+
+def open_source(path):
+    """
+    Memory-maps the file at `path` read-only for lexing. Empty files cannot be mapped and are returned as "".
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def lex_positions(source, lineno=0, pos=0):
+    """
+    Tokenizes `source` (see source_lines) incrementally, yielding a (name, value, line, column, offset)
+    tuple per token. Lines and columns start at 1; `offset` is the character index into the source.
+    INDENT and DEDENT tokens are positioned at the first non-space character of their line and NEWLINE
+    tokens at the end of theirs. If `source` is a fragment of a larger text, `lineno` and `pos` give
+    the number of lines and characters that precede it.
+    """
 
     stack = [0] # indentation level stack
 
     # each iteration is for a new program line
-    while True:
+    for line in source_lines(source):
 
-        if text.startswith("#!#"):
+        if line.startswith("#!#"):
             break # skip code after #!# appears
 
         # find the first ignorable character on current line
-        s = re.search(r"[ \t]*(#.*)?\n", text)
+        s = LINE_END.search(line)
 
         if not s:
-            break # nothing left, we're done
+            break # unterminated last line, we're done
 
-        line = text[:s.start()] # line of interest
-        text = text[s.end():] # remaining text
+        start, end = pos, pos + s.start() # line of interest is line[:end - start]
+        pos += len(line)
+        lineno += 1
 
-        if not line:
+        if start == end:
             continue # empty line, go to next one
 
         # match leading whitespace
-        front = re.match(r"[ ]*", line)
-        l = len(front.group())
+        l = LEADING_SPACE.match(line).end()
 
         if l > stack[-1]:
             stack.append(l) # more whitespace than last line means we are indenting
-            yield Token("INDENT")
+            yield "INDENT", None, lineno, l + 1, start + l
         elif l < stack[-1]: # less whitespace than last line means we are dedenting
             while l < stack[-1]:
                 stack.pop()
-                yield Token("DEDENT")
+                yield "DEDENT", None, lineno, l + 1, start + l
             assert l == stack[-1]
 
         # tokenize the line
-        result = Token.match(line)
-        while result:
-            token, line = result
-            yield token
-            result = Token.match(line)
+        for name, value, col in Token.scan(line, 0, s.start()):
+            yield name, value, lineno, col + 1, start + col
 
         # end of line token
-        yield Token("NEWLINE")
+        yield "NEWLINE", None, lineno, end - start + 1, end
 
     # handle remaining dedents
     while stack and stack[-1] > 0:
         stack.pop()
-        yield Token("DEDENT")
+        yield "DEDENT", None, lineno + 1, 1, pos
+
+def is_top_level(line) -> bool:
+    """
+    Returns true if `line` is a top-level line: it has content and no leading spaces (in a valid
+    program, a 'def' line), or it is the '#!#' line.
+    """
+    if line.startswith("#!#"):
+        return True
+    if not line or line[0] == " ":
+        return False
+    s = LINE_END.search(line)
+    return s is not None and s.start() > 0 # unterminated last lines are never lexed
+
+def source_chunks(source):
+    """
+    Splits `source` (see source_lines) into top-level chunks, yielding (text, lineno, offset) for each,
+    where `lineno` and `offset` count the lines and characters before the chunk. A chunk starts at
+    every top-level line and runs up to the next one; the first chunk also takes any lines before
+    the first top-level line. The indentation stack is back to [0] at every chunk boundary, so lexing
+    a chunk on its own (lex_positions(text, lineno, offset)) yields exactly its slice of the whole
+    token stream: its closing DEDENTs are the ones the next top-level line would emit.
+    """
+    lines, lineno, offset, size = [], 0, 0, 0
+    for line in source_lines(source):
+        if lines and is_top_level(line):
+            yield "".join(lines), lineno, offset
+            lineno, offset = lineno + len(lines), offset + size
+            lines, size = [], 0
+        lines.append(line)
+        size += len(line)
+    if lines:
+        yield "".join(lines), lineno, offset
+
+def lex_text(source):
+    for name, value, _, _, _ in lex_positions(source):
+        yield Token(name, value)
+
+class Kind(object):
+    """
+    Small-int codes for token categories, as stored in a TokenStream.
+    """
+
+    NEWLINE, INDENT, DEDENT = 0, 1, 2
+    EQ, LE, GE, ARROW, NE, LT, GT, ADD, SUB, MUL, DIV, MOD, NOT, AND, OR, LPAREN, RPAREN, COLON, ASSIGN, COMMA = range(3, 23)
+    BOOL, TYPE, KEYWORD, ID, NUM = range(23, 28)
+
+    NAMES = ["NEWLINE", "INDENT", "DEDENT"] + [t.name for t in Token.SCAN_ORDER]
+    CODES = {name : code for code, name in enumerate(NAMES)}
+    PRECEDENCE = [Token.get_precedence(name) for name in NAMES] # indexed by code
+    LEXEMES = [None] * 3 + [t.lexeme for t in Token.SCAN_ORDER] # indexed by code; None unless the value is fixed
+
+class TokenStream(object):
+    """
+    Array-backed token sequence: parallel arrays of kind codes (see Kind), values and
+    (line, column, offset) positions. Identifier, keyword and type values are interned so
+    repeated names share one string. Positions are 0 when unknown (e.g. tokens loaded from JSON).
+    """
+
+    __slots__ = ("kinds", "values", "lines", "cols", "offsets")
+
+    def __init__(self):
+        self.kinds = array("B")
+        self.values = []
+        self.lines = array("I")
+        self.cols = array("I")
+        self.offsets = array("Q")
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, i) -> Token:
+        return Token(Kind.NAMES[self.kinds[i]], self.values[i])
+
+    def __iter__(self):
+        for i in range(len(self.kinds)):
+            yield self[i]
+
+    def append(self, name, value=None, line=0, col=0, offset=0):
+        self.kinds.append(Kind.CODES[name])
+        self.values.append(intern(value) if isinstance(value, str) else value)
+        self.lines.append(line)
+        self.cols.append(col)
+        self.offsets.append(offset)
+
+    def items(self):
+        """
+        Yields a (name, value, line, column, offset) tuple per token, as lex_positions does.
+        """
+        for i in range(len(self.kinds)):
+            yield Kind.NAMES[self.kinds[i]], self.values[i], self.lines[i], self.cols[i], self.offsets[i]
+
+    def position(self, i):
+        """
+        Returns the (line, column, offset) of the `i`th token.
+        """
+        return self.lines[i], self.cols[i], self.offsets[i]
+
+    def extend(self, other, line_delta=0, offset_delta=0):
+        """
+        Appends the tokens of `other`, shifting their positions by the given deltas.
+        """
+        self.kinds.extend(other.kinds)
+        self.values.extend(other.values)
+        if line_delta or offset_delta:
+            self.lines.extend(line + line_delta for line in other.lines)
+            self.offsets.extend(offset + offset_delta for offset in other.offsets)
+        else:
+            self.lines.extend(other.lines)
+            self.offsets.extend(other.offsets)
+        self.cols.extend(other.cols)
+
+    @classmethod
+    def from_text(cls, source, lineno=0, pos=0):
+        """
+        Lexes `source`, which may be a string, a file object or an mmap (see source_lines).
+        """
+        stream = cls()
+        for name, value, line, col, offset in lex_positions(source, lineno, pos):
+            stream.append(name, value, line, col, offset)
+        return stream
 
-def lexer_main(pretty=False):
-    tokens = list(lex_text(sys.stdin.read()))
+    @classmethod
+    def from_tokens(cls, tokens):
+        stream = cls()
+        for token in tokens:
+            stream.append(token.name, token.value)
+        return stream
+
+    @classmethod
+    def from_binary(cls, data):
+        """
+        Loads a token stream written by dump_binary from `data` (bytes or an mmap).
+        """
+        if data[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+            raise Exception("Not a binary token stream")
+        pos = len(BINARY_MAGIC)
+        count, pos = read_varint(data, pos)
+
+        num_strings, pos = read_varint(data, pos)
+        strings = []
+        for _ in range(num_strings):
+            length, pos = read_varint(data, pos)
+            strings.append(intern(bytes(data[pos:pos + length]).decode()))
+            pos += length
+
+        kinds, pos = read_varint_section(data, pos)
+        raw_values, pos = read_varint_section(data, pos)
+        line_deltas, pos = read_varint_section(data, pos)
+        cols, pos = read_varint_section(data, pos)
+        offset_deltas, pos = read_varint_section(data, pos)
+        if not len(kinds) == len(line_deltas) == len(cols) == len(offset_deltas) == count:
+            raise Exception("Corrupt binary token stream")
+
+        # kinds below BOOL have fixed values; BOOL, TYPE, KEYWORD, ID and NUM take the next raw value
+        raw_values = iter(raw_values)
+        lexemes, BOOL, NUM = Kind.LEXEMES, Kind.BOOL, Kind.NUM
+        values = [lexemes[k] if k < BOOL
+                  else strings[next(raw_values)] if BOOL < k < NUM
+                  else next(raw_values) if k == NUM
+                  else next(raw_values) == 1
+                  for k in kinds]
+
+        stream = cls()
+        stream.kinds = array("B", kinds)
+        stream.values = values
+        stream.lines = array("I", accumulate(line_deltas))
+        stream.cols = array("I", cols)
+        stream.offsets = array("Q", accumulate(offset_deltas))
+        return stream
+
+"""
+Binary token-stream format, a compact alternative to the JSON token dump. It is laid out by column
+so that loading is mostly bulk conversions:
+
+    "CPTK" followed by a version byte (1)
+    varint       number of tokens
+    string table varint count, then per string a varint byte length and the UTF-8 bytes;
+                 ID, KEYWORD and TYPE values are indices into it
+    kinds        section of one varint Kind code per token
+    values       section of one varint per ID/KEYWORD/TYPE (string index), NUM (the number) and
+                 BOOL (0 or 1) token, in token order; other kinds have fixed values (see Kind.LEXEMES)
+    lines        section of one varint per token, the line delta from the previous token
+    columns      section of one varint per token
+    offsets      section of one varint per token, the offset delta from the previous token
+
+Each section is prefixed by its varint length in bytes. Varints are little-endian base-128: 7 bits
+per byte, high bit set on every byte but the last. Positions never decrease along a token stream
+(they are all 0 when unknown), so the deltas are unsigned.
+"""
+BINARY_MAGIC = b"CPTK\x01"
+
+def write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def read_varint(data, pos):
+    """
+    Returns the varint at `data[pos]` and the position after it.
+    """
+    b = data[pos]
+    pos += 1
+    n, shift = b & 0x7f, 7
+    while b & 0x80:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        shift += 7
+    return n, pos
+
+def read_varint_section(data, pos):
+    """
+    Returns the varints of the length-prefixed section at `data[pos]` and the position after it.
+    """
+    length, pos = read_varint(data, pos)
+    end = pos + length
+    section = bytes(data[pos:end])
+    if max(section, default=0) < 0x80:
+        return list(section), end # every varint is a single byte
+    values = []
+    while pos < end:
+        n, pos = read_varint(data, pos)
+        values.append(n)
+    return values, end
+
+def dump_binary(tokens, f):
+    """
+    Writes (name, value, line, column, offset) tuples (as produced by lex_positions or TokenStream.items)
+    to the binary file object `f` in the binary token-stream format.
+    """
+    strings = {}
+    kinds, values, lines, cols, offsets = bytearray(), bytearray(), bytearray(), bytearray(), bytearray()
+    count = prev_line = prev_offset = 0
+    for name, value, line, col, offset in tokens:
+        kind = Kind.CODES[name]
+        write_varint(kinds, kind)
+        if kind == Kind.NUM:
+            write_varint(values, value)
+        elif kind == Kind.BOOL:
+            values.append(1 if value else 0)
+        elif kind in (Kind.ID, Kind.KEYWORD, Kind.TYPE):
+            write_varint(values, strings.setdefault(value, len(strings)))
+        write_varint(lines, line - prev_line)
+        write_varint(cols, col)
+        write_varint(offsets, offset - prev_offset)
+        prev_line, prev_offset = line, offset
+        count += 1
+
+    header = bytearray(BINARY_MAGIC)
+    write_varint(header, count)
+    write_varint(header, len(strings))
+    for string in strings:
+        encoded = string.encode()
+        write_varint(header, len(encoded))
+        header += encoded
+    f.write(header)
+    for section in (kinds, values, lines, cols, offsets):
+        prefix = bytearray()
+        write_varint(prefix, len(section))
+        f.write(prefix)
+        f.write(section)
+
+def lexer_main(pretty=False, path=None, binary=False):
+    source = open_source(path) if path else sys.stdin
+    if binary:
+        dump_binary(lex_positions(source), sys.stdout.buffer)
+        return
+    tokens = lex_text(source)
     if pretty:
         for token in tokens:
             print(token)
     else:
-        json.dump(list(map(lambda t: t.to_dict(), tokens)), sys.stdout, indent=4)
+        # same layout as json.dump(..., indent=4), written one token at a time
+        sep = "[\n"
+        for token in tokens:
+            sys.stdout.write(sep + textwrap.indent(json.dumps(token.to_dict(), indent=4), " " * 4))
+            sep = ",\n"
+        sys.stdout.write("[]" if sep == "[\n" else "\n]")
 
 if __name__ == "__main__":
-    lexer_main("-p" in sys.argv)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("-")]
+    lexer_main("-p" in sys.argv, args[0] if args else None, "--binary" in sys.argv)
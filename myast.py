@@ -1,8 +1,42 @@
+import operator
+import functools
+from enum import Enum
+from bril import Function, FunctionBuilder
+from opt import optimize, inline_functions
+
+class Op(Enum):
+    """
+    Operators of BinOpExpr and UnOpExpr. Nodes share these members instead of each holding a name; the
+    value is the Bril opcode the operator lowers to.
+    """
+    OR = "or"
+    AND = "and"
+    NOT = "not"
+    EQ = "eq"
+    NE = "ne"
+    LT = "lt"
+    GT = "gt"
+    LE = "le"
+    GE = "ge"
+    ADD = "add"
+    SUB = "sub"
+    MUL = "mul"
+    DIV = "div"
+    MOD = "mod"
+
+    def __str__(self):
+        return self.name
+
 class Ast(object):
-    pass
+    """
+    Every node declares its fields in __slots__, so nodes carry no per-instance __dict__.
+    """
+    __slots__ = ()
 
 class TypedVar(Ast):
 
+    __slots__ = ("name", "type")
+
     def __init__(self, name: str, type: str):
         self.name = name
         self.type = type
@@ -10,170 +44,625 @@ class TypedVar(Ast):
     def __repr__(self):
         return f"TypedVar(name={self.name}, type={self.type})"
 
+def postorder(root, children):
+    """
+    Yields the nodes of the tree at `root` in post-order (children left to right, then the node),
+    where `children(node)` lists a node's children. Uses an explicit stack, so depth is unbounded.
+    """
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            yield node
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(children(node)))
+
+OP_SYMBOLS = {Op.OR : "or", Op.AND : "and", Op.NOT : "not",
+              Op.EQ : "==", Op.NE : "!=", Op.LT : "<", Op.GT : ">", Op.LE : "<=", Op.GE : ">=",
+              Op.ADD : "+", Op.SUB : "-", Op.MUL : "*", Op.DIV : "//", Op.MOD : "%"}
+
+INT_MIN, INT_MAX = -2**63, 2**63 - 1 # range of a Bril int
+
+FOLDERS = {Op.OR : lambda lhs, rhs: lhs or rhs, Op.AND : lambda lhs, rhs: lhs and rhs,
+           Op.EQ : operator.eq, Op.NE : operator.ne, Op.LT : operator.lt, Op.GT : operator.gt, Op.LE : operator.le, Op.GE : operator.ge,
+           Op.ADD : operator.add, Op.SUB : operator.sub, Op.MUL : operator.mul, Op.DIV : operator.floordiv, Op.MOD : operator.mod}
+
+def fold_binop(op, lhs, rhs) -> int | bool | None:
+    """
+    Returns the value of `lhs op rhs` for constant operands, with ChocoPy semantics: // rounds toward
+    negative infinity and % takes the sign of the divisor, as in Python (Bril's div truncates instead).
+    Returns None where the operation must be left to run time: division by zero, or a result that does
+    not fit a Bril int.
+    """
+    if op in {Op.DIV, Op.MOD} and rhs == 0:
+        return None
+    value = FOLDERS[op](lhs, rhs)
+    if not isinstance(value, bool) and not INT_MIN <= value <= INT_MAX:
+        return None
+    return value
+
+"""
+Identities x op c == x and c op x == x, by operator: the constants c that can be dropped from the
+right and from the left. Only a constant operand is ever dropped, so no side effect is lost.
+"""
+RIGHT_IDENTITIES = {Op.ADD : 0, Op.SUB : 0, Op.MUL : 1, Op.DIV : 1, Op.AND : True, Op.OR : False}
+LEFT_IDENTITIES = {Op.ADD : 0, Op.MUL : 1, Op.AND : True, Op.OR : False}
+
+"""
+Operators that, as in Python, evaluate their right operand only if the left one does not decide the
+result: False and x, True or x.
+"""
+SHORT_CIRCUIT_OPS = {Op.AND, Op.OR}
+
+"""
+The largest condition, in expression nodes, that a while loop tests both before its first iteration
+and at the end of each one rather than once at the top, with a jump back to it: testing at the end
+saves that jump on every iteration, but a long condition is not worth emitting twice.
+"""
+ROTATED_TEST_SIZE = 16
+
+"""
+Defaults of Unrolling: the most copies of its body a for loop that is not unrolled fully runs per
+test, and the most instructions unrolling one loop may add to the code.
+"""
+UNROLL_FACTOR = 4
+UNROLL_BUDGET = 64
+
+def require_value(expr, scope, errors) -> str | None:
+    """
+    Returns the type of `expr`, already typed, where a value is required. A call to a function without
+    a return type is reported here; any other expression without a type was reported when it was typed.
+    """
+    if expr.type is None and isinstance(expr, CallExpr) and expr.name in scope.type_map:
+        errors.append(scope.error(expr, f"'{expr.name}' does not return a value"))
+    return expr.type
+
 class Expr(Ast):
-    pass
+    """
+    `line` and `col` locate the token the expression is reported at, the line counted from the line
+    of the enclosing 'def' so it stays valid when the function moves (0 if unknown). `type` is filled
+    in by check_types: "int", "bool", or None for an expression without a value.
+    """
+
+    __slots__ = ("line", "col", "type")
+
+    def children(self):
+        """
+        Sub-expressions evaluated before this expression, in evaluation order.
+        """
+        return []
+
+    def check_types(self, scope, errors):
+        """
+        Annotates this expression and each of its sub-expressions with its type, appending a message
+        to `errors` for every ill-typed one. Nodes are typed once each, in post-order by an explicit-stack
+        walk, from the types already annotated on their children.
+        """
+        for node in postorder(self, lambda node: node.children()):
+            node.infer_type(scope, errors)
+        return self.type
+
+    def value_types(self, scope, errors) -> list[str | None]:
+        """
+        Returns the types of the children, which must all have values (see require_value).
+        """
+        return [require_value(child, scope, errors) for child in self.children()]
+
+    def reverse_postorder(self) -> list["Expr"]:
+        """
+        Lists the nodes of this expression with every node before its children, the children last to
+        first; reversed, that is post-order. Walks with an explicit stack, so depth is unbounded.
+        """
+        order, stack = [], [self]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(node.children())
+        return order
+
+    def fold(self) -> "Expr":
+        """
+        Returns this expression with every constant sub-expression evaluated (see fold_binop) and
+        the identities x+0, x-0, x*1, x//1, x and True, x or False, not not x and - - x applied, from
+        the leaves up; False and x and True or x are False and True, as x is never evaluated. Nodes that
+        do not change are shared with this tree rather than copied, and this tree is left as it is.
+        """
+        folded = []
+        for node in reversed(self.reverse_postorder()):
+            n = len(node.children())
+            children = folded[len(folded)-n:]
+            del folded[len(folded)-n:]
+            folded.append(node.simplify(children))
+        return folded[0]
+
+    def simplify(self, children) -> "Expr":
+        """
+        Returns the simplest expression equivalent to this node with its children replaced by
+        `children`, already simplified.
+        """
+        return self
+
+    def build(self, builder) -> str | None:
+        """
+        Appends the instructions that compute this expression to `builder` and returns the register
+        holding its value (None for a call without a return type). Reads the types annotated by
+        check_types, and folds the expression first if the builder says so.
+        """
+        return (self.fold() if builder.fold else self).lower(builder)
+
+    def lower(self, builder) -> str | None:
+        """
+        Does the work of build for an expression already folded. Nodes are visited in post-order, each
+        emitting its instructions from the registers of its children, so deep expressions do not
+        recurse. `and` and `or` also emit a branch between their operands (see BinOpExpr.emit_branch).
+        """
+        emits, stack = [], [self] # emits is in reverse order, like reverse_postorder
+        truncated = set() # ids of the `%` nodes only compared with 0, see BinOpExpr.emit
+        while stack:
+            node = stack.pop()
+            if not isinstance(node, Expr): # the branch of an `and` or `or`
+                emits.append(node)
+            elif type(node) is BinOpExpr and node.op in SHORT_CIRCUIT_OPS:
+                label = builder.next_label()
+                emits.append(functools.partial(node.emit_join, label=label))
+                stack += [node.left, functools.partial(node.emit_branch, label=label), node.right]
+            else:
+                if type(node) is BinOpExpr and node.op in {Op.EQ, Op.NE}:
+                    truncated.update(id(child) for child in node.children() if type(child) is BinOpExpr and node.is_divisibility_test())
+                emits.append(functools.partial(node.emit, truncate=True) if id(node) in truncated else node.emit)
+                stack += node.children()
+        dests = [] # registers of the values computed so far and not yet used; emit pops its operands
+        for emit in reversed(emits):
+            dests.append(emit(builder, dests))
+        return dests[0]
+
+    def build_branch(self, builder, true_label, false_label):
+        """
+        Appends instructions that jump to `true_label` if this condition holds and to `false_label`
+        if not. The operands of `and`, `or` and `not` branch to the labels themselves rather than
+        computing a bool to branch on, and the right operand of `and` and `or` is skipped when the
+        left one decides the result; `!=` branches on `==` with the labels swapped. Walks with an
+        explicit stack, so deep conditions do not recurse.
+        """
+        stack = [(self.fold() if builder.fold else self, true_label, false_label, None)]
+        while stack:
+            node, true_label, false_label, label = stack.pop()
+            if label: builder.add_label(label)
+            if isinstance(node, BinOpExpr) and node.op in SHORT_CIRCUIT_OPS:
+                label = f"{node.op.value}.{builder.next_label()}" # where the right operand is tested
+                stack.append((node.right, true_label, false_label, label))
+                if node.op == Op.AND: stack.append((node.left, label, false_label, None))
+                else: stack.append((node.left, true_label, label, None))
+            elif isinstance(node, UnOpExpr) and node.op == Op.NOT:
+                stack.append((node.expr, false_label, true_label, None))
+            elif isinstance(node, BinOpExpr) and node.op == Op.NE: # branches on == the other way, saving its `not`
+                equal = BinOpExpr(Op.EQ, node.left, node.right, node.line, node.col)
+                equal.type = node.type
+                stack.append((equal, false_label, true_label, None))
+            elif isinstance(node, Literal):
+                builder.add("jmp", labels=[true_label if node.value else false_label])
+            else:
+                builder.add("br", args=[node.lower(builder)], labels=[true_label, false_label])
 
 class IdExpr(Expr):
 
-    def __init__(self, name):
+    __slots__ = ("name",)
+
+    def __init__(self, name, line=0, col=0):
         self.name = name
+        self.line = line
+        self.col = col
+        self.type = None
 
     def __repr__(self):
         return f"IdExpr(name={self.name})"
 
-    def get_type(self, scope):
-        return scope.get_type(self.name)
+    def infer_type(self, scope, errors):
+        self.type = scope.get_type(self.name)
+        if self.type is None:
+            errors.append(scope.error(self, f"'{self.name}' is not a variable"))
 
-    def get_instrs(self, scope):
-        dest = scope.next_reg()
-        return [{"dest" : dest, "op" : "id", "type" : self.get_type(scope), "args" : [self.name]}]
+    def emit(self, builder, dests):
+        dest = builder.next_reg()
+        builder.add("id", dest, self.type, [self.name])
+        return dest
 
 class CallExpr(Expr):
 
-    def __init__(self, name, args):
+    __slots__ = ("name", "args")
+
+    def __init__(self, name, args, line=0, col=0):
         self.name = name
         self.args = args
+        self.line = line
+        self.col = col
+        self.type = None
 
     def __repr__(self):
         return f"CallExpr(name={self.name}, args={self.args})"
 
-    def get_type(self, scope):
-        return scope.get_type(self.name)
-
-    def get_instrs(self, scope):
-        args, instrs = [], []
-        for arg in self.args:
-            instrs += arg.get_instrs(scope)
-            args.append(instrs[-1]["dest"])
-
-        instrs.append({"op" : "call", "funcs" : [self.name], "args" : args})
-
-        type = self.get_type(scope)
-        if type:
-            dest = scope.next_reg()
-            instrs[-1]["dest"] = dest
-            instrs[-1]["type"] = type
-
-        return instrs
+    def children(self):
+        return self.args
+
+    def infer_type(self, scope, errors):
+        self.value_types(scope, errors)
+        if self.name not in scope.type_map:
+            errors.append(scope.error(self, f"'{self.name}' is not defined"))
+        self.type = scope.get_type(self.name)
+
+    def simplify(self, children):
+        if all(new is old for new, old in zip(children, self.args)):
+            return self
+        call = CallExpr(self.name, children, self.line, self.col)
+        call.type = self.type
+        return call
+
+    def emit(self, builder, dests):
+        args = dests[len(dests)-len(self.args):]
+        del dests[len(dests)-len(self.args):]
+        dest = builder.next_reg() if self.type else None
+        builder.add("call", dest, self.type, args, funcs=[self.name])
+        return dest
 
 class BinOpExpr(Expr):
 
-    def __init__(self, op, left, right):
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op, left, right, line=0, col=0):
         self.op = op
         self.left = left
         self.right = right
+        self.line = line
+        self.col = col
+        self.type = None
 
     def __repr__(self):
         return f"BinOpExpr(op={self.op}, left={self.left}, right={self.right})"
 
-    def get_type(self, scope):
-        lhs = self.left.get_type(scope)
-        rhs = self.right.get_type(scope)
-        if self.op in {"ADD", "SUB", "MUL", "DIV", "MOD"}:
-            assert lhs == "int" and rhs == "int"
-            return "int"
-        elif self.op in {"LT", "GT", "LE", "GE"}:
-            assert lhs == "int" and rhs == "int"
-            return "bool"
-        elif self.op in {"EQ", "NE"}:
-            assert lhs == rhs
-            return "bool"
-        elif self.op in {"AND", "OR"}:
-            assert lhs == "bool" and rhs == "bool"
-            return "bool"
+    def children(self):
+        return [self.left, self.right]
+
+    def infer_type(self, scope, errors):
+        lhs, rhs = self.value_types(scope, errors)
+        if self.op in {Op.ADD, Op.SUB, Op.MUL, Op.DIV, Op.MOD}:
+            self.type, ok = "int", lhs == rhs == "int"
+        elif self.op in {Op.LT, Op.GT, Op.LE, Op.GE}:
+            self.type, ok = "bool", lhs == rhs == "int"
+        elif self.op in {Op.EQ, Op.NE}:
+            self.type, ok = "bool", lhs == rhs == "int" # TODO: implement version that works for bools as well
+        elif self.op in {Op.AND, Op.OR}:
+            self.type, ok = "bool", lhs == rhs == "bool"
         else:
-            raise Exception()
-
-    @staticmethod
-    def traverse(node, scope, instrs, stack):
-        if isinstance(node, BinOpExpr):
-            BinOpExpr.traverse(node.left, scope, instrs, stack)
-            BinOpExpr.traverse(node.right, scope, instrs, stack)
-            rhs = stack.pop()
-            lhs = stack.pop()
-            dest = scope.next_reg()
-            op = node.op.lower()
-            ltype = node.left.get_type(scope)
-            rtype = node.right.get_type(scope)
-            if op == "mod":
-                assert ltype == "int" and rtype == "int"
-                instrs.append({"dest" : dest, "op" : "div", "type" : "int", "args" : [lhs, rhs]})
-                instrs.append({"dest" : dest, "op" : "mul", "type" : "int", "args" : [dest, rhs]})
-                instrs.append({"dest" : dest, "op" : "sub", "type" : "int", "args" : [lhs, dest]})
-            elif op in {"lt", "gt", "le", "ge"}:
-                assert ltype == "int" and rtype == "int"
-                instrs.append({"dest" : dest, "op" : op, "type" : "bool", "args" : [lhs, rhs]})
-            elif op in {"eq", "ne"}:
-                assert ltype == "int" and rtype == "int" # TODO: implement version that works for bools as well
-                instrs.append({"dest" : dest, "op" : "eq", "type" : "bool", "args" : [lhs, rhs]})
-                if op == "ne":
-                    instrs.append({"dest" : dest, "op" : "not", "type" : "bool", "args" : [dest]})
-            elif op  in {"or", "and"}:
-                assert ltype == "bool" and rtype == "bool"
-                instrs.append({"dest" : dest, "op" : op, "type" : "bool", "args" : [lhs, rhs]})
-            elif op in {"add", "sub", "mul", "div"}:
-                assert ltype == "int" and rtype == "int"
-                instrs.append({"dest" : dest, "op" : op, "type" : "int", "args" : [lhs, rhs]})
-            else:
-                raise Exception()
-            stack.append(dest)
+            errors.append(scope.error(self, f"'{OP_SYMBOLS[self.op]}' is not a binary operator"))
+            return
+        if not ok and lhs and rhs:
+            errors.append(scope.error(self, f"unsupported operand types for '{OP_SYMBOLS[self.op]}': {lhs} and {rhs}"))
+
+    def simplify(self, children):
+        left, right = children
+        if isinstance(left, Literal) and isinstance(right, Literal):
+            value = fold_binop(self.op, left.value, right.value)
+            if value is not None:
+                return Literal(value, self.type, self.line, self.col)
+        if isinstance(right, Literal) and self.op in RIGHT_IDENTITIES and right.value == RIGHT_IDENTITIES[self.op]:
+            return left
+        if isinstance(left, Literal) and self.op in LEFT_IDENTITIES and left.value == LEFT_IDENTITIES[self.op]:
+            return right
+        if isinstance(left, Literal) and self.op in SHORT_CIRCUIT_OPS: # the right operand is never evaluated
+            return left
+        if left is self.left and right is self.right:
+            return self
+        binop = BinOpExpr(self.op, left, right, self.line, self.col)
+        binop.type = self.type
+        return binop
+
+    def emit_branch(self, builder, dests, label) -> str:
+        """
+        Emits the test of the left operand of `and` or `or`, which skips the right operand if it
+        decides the result, and leaves its register, which will hold the result, where it was.
+        """
+        lhs = dests.pop()
+        rhs_label, join_label = f"{self.op.value}.{label}", f"join.{label}"
+        builder.add("br", args=[lhs], labels=[rhs_label, join_label] if self.op == Op.AND else [join_label, rhs_label])
+        builder.add_label(rhs_label)
+        return lhs
+
+    def emit_join(self, builder, dests, label) -> str:
+        rhs = dests.pop()
+        lhs = dests.pop()
+        builder.add("id", lhs, "bool", [rhs])
+        builder.add_label(f"join.{label}")
+        return lhs
+
+    def is_divisibility_test(self) -> bool:
+        """
+        Returns True if this compares `x % y` with 0 by == or !=, which gives the same answer for the
+        remainder of Bril's truncating div as for Python's.
+        """
+        left, right = self.left, self.right
+        if isinstance(left, Literal): left, right = right, left
+        return (self.op in {Op.EQ, Op.NE} and type(left) is BinOpExpr and left.op == Op.MOD
+                and isinstance(right, Literal) and right.value == 0 and right.type == "int")
+
+    def emit(self, builder, dests, truncate=False):
+        """
+        Emits the operation on the registers of its operands. `//` and `%` round the quotient toward
+        negative infinity, as in Python, by correcting the result of Bril's div, which truncates: when
+        the remainder is not zero and its sign is not the divisor's, the quotient is one less and the
+        remainder larger by the divisor. A `%` emitted with `truncate` set skips the correction.
+        """
+        rhs = dests.pop()
+        lhs = dests.pop()
+        dest = builder.next_reg()
+        op = self.op.value
+        if op in {"div", "mod"}:
+            quotient, rem = (dest, builder.next_reg()) if op == "div" else (builder.next_reg(), dest)
+            builder.add("div", quotient, "int", [lhs, rhs])
+            builder.add("mul", rem, "int", [quotient, rhs])
+            builder.add("sub", rem, "int", [lhs, rem])
+            if not truncate:
+                self.emit_floor(builder, dest, rem, rhs)
+        elif op in {"eq", "ne"}:
+            builder.add("eq", dest, "bool", [lhs, rhs])
+            if op == "ne":
+                builder.add("not", dest, "bool", [dest])
         else:
-            instrs += node.get_instrs(scope)
-            dest = instrs[-1]["dest"]
-            stack.append(dest)
-
-    def get_instrs(self, scope):
-        instrs, stack = [], []
-        BinOpExpr.traverse(self, scope, instrs, stack)
-        return instrs
+            builder.add(op, dest, self.type, [lhs, rhs])
+        return dest
+
+    def emit_floor(self, builder, dest, rem, rhs):
+        """
+        Emits the correction of `dest`, the quotient or the remainder `rem` of a truncating division
+        by `rhs`, that makes it Python's (see emit). A divisor known to be positive only needs the
+        sign of the remainder tested.
+        """
+        label = builder.next_label()
+        fix_label, done_label = f"floor.{label}", f"floored.{label}"
+        zero, cond = builder.next_reg(), builder.next_reg()
+        builder.add("const", zero, "int", value=0)
+        if isinstance(self.right, Literal) and self.right.value > 0:
+            builder.add("lt", cond, "bool", [rem, zero])
+            builder.add("br", args=[cond], labels=[fix_label, done_label])
+        else:
+            neg_label, pos_label = f"floor.neg.{label}", f"floor.pos.{label}"
+            builder.add("eq", cond, "bool", [rem, zero])
+            builder.add("br", args=[cond], labels=[done_label, f"floor.test.{label}"])
+            builder.add_label(f"floor.test.{label}")
+            rhs_neg = builder.next_reg()
+            builder.add("lt", cond, "bool", [rem, zero])
+            builder.add("lt", rhs_neg, "bool", [rhs, zero])
+            builder.add("br", args=[cond], labels=[neg_label, pos_label])
+            builder.add_label(neg_label)
+            builder.add("br", args=[rhs_neg], labels=[done_label, fix_label])
+            builder.add_label(pos_label)
+            builder.add("br", args=[rhs_neg], labels=[fix_label, done_label])
+        builder.add_label(fix_label)
+        if dest == rem:
+            builder.add("add", dest, "int", [dest, rhs])
+        else:
+            one = builder.next_reg()
+            builder.add("const", one, "int", value=1)
+            builder.add("sub", dest, "int", [dest, one])
+        builder.add_label(done_label)
 
 class UnOpExpr(Expr):
 
-    def __init__(self, op, expr):
+    __slots__ = ("op", "expr")
+
+    def __init__(self, op, expr, line=0, col=0):
         self.op = op
         self.expr = expr
+        self.line = line
+        self.col = col
+        self.type = None
 
     def __repr__(self):
         return f"UnOpExpr(op={self.op}, expr={self.expr})"
 
-    def get_type(self, scope):
-        return self.expr.get_type(scope)
-
-    def get_instrs(self, scope):
-        instrs = self.expr.get_instrs(scope)
-        dest = instrs[-1]["dest"]
-        op = self.op.lower()
-        if op == "not":
-            assert self.get_type(scope) == "bool"
-            instrs.append({"op" : self.op.lower(), "dest" : dest, "type" : "bool", "args" : [dest]})
+    def children(self):
+        return [self.expr]
+
+    def infer_type(self, scope, errors):
+        type, = self.value_types(scope, errors)
+        self.type = "bool" if self.op == Op.NOT else "int"
+        if type and type != self.type:
+            errors.append(scope.error(self, f"unsupported operand type for '{OP_SYMBOLS[self.op]}': {type}"))
+
+    def simplify(self, children):
+        expr, = children
+        if isinstance(expr, Literal) and (self.op == Op.NOT or expr.value != INT_MIN):
+            return Literal(not expr.value if self.op == Op.NOT else -expr.value, self.type, self.line, self.col)
+        if isinstance(expr, UnOpExpr) and expr.op == self.op:
+            return expr.expr
+        if expr is self.expr:
+            return self
+        unop = UnOpExpr(self.op, expr, self.line, self.col)
+        unop.type = self.type
+        return unop
+
+    def emit(self, builder, dests):
+        dest = dests.pop()
+        if self.op == Op.NOT:
+            builder.add("not", dest, "bool", [dest])
         else:
-            assert op == "sub"
-            tmp = scope.next_reg()
-            instrs.append({"op" : "const", "dest" : tmp, "type" : "int", "value" : -1})
-            instrs.append({"op" : "mul", "dest" : dest, "type" : "int", "args" : [dest, tmp]})
-        return instrs
+            tmp = builder.next_reg()
+            builder.add("const", tmp, "int", value=-1)
+            builder.add("mul", dest, "int", [dest, tmp])
+        return dest
 
 class Literal(Expr):
 
-    def __init__(self, value: int | bool, type: str):
+    __slots__ = ("value",)
+
+    def __init__(self, value: int | bool, type: str, line=0, col=0):
         self.value = value
         self.type = type
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"Literal(value={self.value}, type={self.type})"
 
-    def get_instrs(self, scope):
-        dest = scope.next_reg()
-        return [{"dest" : dest, "op" : "const", "type" : self.type, "value" : self.value}]
+    def infer_type(self, scope, errors):
+        pass
 
-    def get_type(self, scope):
-        return self.type
+    def emit(self, builder, dests):
+        dest = builder.next_reg()
+        builder.add("const", dest, self.type, value=self.value)
+        return dest
 
 class Stmt(Ast):
-    pass
+
+    __slots__ = ()
+
+    def check_value(self, expr, scope, errors) -> str | None:
+        expr.check_types(scope, errors)
+        return require_value(expr, scope, errors)
+
+    def check_cond(self, cond, scope, errors):
+        type = self.check_value(cond, scope, errors)
+        if type and type != "bool":
+            errors.append(scope.error(cond, f"condition must be bool, not {type}"))
+
+    def exprs(self) -> list[Expr]:
+        """
+        The expressions the statement evaluates, not counting those of the statements nested in it.
+        """
+        return []
+
+    def blocks(self) -> list[list["Stmt"]]:
+        """
+        The blocks of statements nested in the statement.
+        """
+        return []
+
+def block_vars(block) -> tuple[set[str], set[str]]:
+    """
+    Returns the variables read and the variables assigned by the statements of `block`, nested ones
+    included. Walks with an explicit stack, so nesting is unbounded.
+    """
+    reads, writes = set(), set()
+    stack = list(block)
+    while stack:
+        stmt = stack.pop()
+        for expr in stmt.exprs():
+            reads.update(node.name for node in expr.reverse_postorder() if isinstance(node, IdExpr))
+        if isinstance(stmt, AssignStmt): writes.add(stmt.dest)
+        elif isinstance(stmt, ForStmt): writes.add(stmt.iter_name)
+        for nested in stmt.blocks(): stack.extend(nested)
+    return reads, writes
+
+class Unrolled(object):
+    """
+    What Unrolling.plan decided for one for loop: the copies of its body emitted one after another
+    and the trips of the loop around them (no loop for one trip), for each part of the range in turn.
+    """
+
+    __slots__ = ("func", "loop", "size", "plan", "added", "saved", "reason")
+
+    def __init__(self, func, loop, size, plan, added, saved, reason=None):
+        self.func = func
+        self.loop = loop # the ForStmt
+        self.size = size # instructions of one copy of the body
+        self.plan = plan # [(copies, trips)]
+        self.added = added # instructions added to the code, and saved when the loop runs, by the plan
+        self.saved = saved
+        self.reason = reason # why the loop is kept as it is, or None
+
+    def __repr__(self):
+        return f"Unrolled({self.loop.iter_name} in @{self.func}: {self.plan})"
+
+    def report(self) -> str:
+        """
+        Returns a line saying what was done with the loop and what it costs and saves.
+        """
+        loop = f"@{self.func}: for {self.loop.iter_name} in range({', '.join(map(str, self.loop.bounds))})"
+        if self.reason:
+            return f"{loop}: kept, {self.reason}"
+        copies, trips = self.plan[-1]
+        if trips == 1:
+            how = f"unrolled fully into {copies} cop{'ies' if copies > 1 else 'y'}"
+        elif len(self.plan) == 1:
+            how = f"unrolled by {copies}"
+        else:
+            extra = self.plan[0][1]
+            how = f"unrolled by {copies} after " + ("1 iteration" if extra == 1 else f"a loop of {extra} iterations")
+        return f"{loop}: {how}, {self.size} instructions a copy, +{self.added} instructions, saves {self.saved} per run"
+
+class Unrolling(object):
+    """
+    Decides how ForStmt.build unrolls each for loop, from its trip count, constant as its bounds are,
+    and the size of its body, and keeps an Unrolled record of every decision in `loops`, by loop.
+
+    A loop is unrolled fully if that adds at most `budget` instructions; otherwise it is unrolled by
+    the largest factor up to `factor` that does, its trips running that many copies of the body
+    after the iterations left over, which get a loop of their own if there are more than one. Either way the counter is updated once per trip,
+    rather than once per iteration, if the body does not read it, and tested once per trip. A loop
+    whose body assigns its counter is left alone.
+    """
+
+    __slots__ = ("factor", "budget", "func", "loops")
+
+    def __init__(self, factor=UNROLL_FACTOR, budget=UNROLL_BUDGET):
+        self.factor = factor
+        self.budget = budget
+        self.func = None # the function being built, for the records
+        self.loops = {}
+
+    def plan(self, loop, trips, size, reads) -> list[tuple[int, int]]:
+        """
+        Returns how to emit `loop`, which iterates `trips` times over a body of `size` instructions,
+        reading its counter if `reads` is set: the number of copies of the body and of trips around
+        them for each part of the range, in order.
+        """
+        kept = [(1, trips)]
+        plans = [[(trips, 1)]] # fully unrolled first, then by decreasing factor
+        for factor in range(min(self.factor, trips // 2), 1, -1):
+            left, extra = divmod(trips, factor)
+            plans.append(([(1, extra)] if extra else []) + [(factor, left)])
+
+        reason, chosen = None, kept
+        if loop.iter_name in block_vars(loop.block)[1]:
+            reason = f"its body assigns {loop.iter_name}"
+        else:
+            for plan in plans:
+                if code_size(plan, size, reads) - code_size(kept, size, reads) <= self.budget:
+                    chosen = plan
+                    break
+            else:
+                reason = f"unrolling its body of {size} instructions would add more than {self.budget}"
+        if loop not in self.loops:
+            added = code_size(chosen, size, reads) - code_size(kept, size, reads)
+            saved = run_size(kept, reads) - run_size(chosen, reads)
+            self.loops[loop] = Unrolled(self.func, loop, size, chosen, added, saved, reason)
+        return chosen
+
+def code_size(plan, size, reads) -> int:
+    """
+    Returns the instructions ForStmt.build emits for `plan` (see Unrolling.plan) with a body of `size`
+    instructions, besides the constants it emits in any case.
+    """
+    total = 0
+    for copies, trips in plan:
+        total += copies * (size + reads) + (not reads) * (1 + (copies > 1))
+        if trips > 1: total += 3 # the constant the counter ends at, the test and the branch
+    return total
+
+def run_size(plan, reads) -> int:
+    """
+    Returns the instructions that keep count, besides the body, executed by `plan`.
+    """
+    total = 0
+    for copies, trips in plan:
+        total += trips * (copies if reads else 1) + (not reads and copies > 1)
+        if trips > 1: total += 2 * trips + 1
+    return total
 
 class ForStmt(Stmt):
 
+    __slots__ = ("iter_name", "bounds", "block")
+
     def __init__(self, iter_name: str, bounds: list[int], block: list[Stmt]):
         self.iter_name = iter_name
         self.bounds = bounds
@@ -182,46 +671,71 @@ class ForStmt(Stmt):
     def __repr__(self):
         return f"ForStmt(iter_name={self.iter_name}, bounds={self.bounds}, block={self.block})"
 
-    def get_instrs(self, scope):
-
-        label = scope.next_label()
-        entry_label = f"entry.{label}"
-        body_label = f"body.{label}"
-        exit_label = f"exit.{label}"
-
+    def check_types(self, scope, errors):
         scope.type_map[self.iter_name] = "int"
-
-        instrs = []
-        term = None
-
-        if len(self.bounds) == 1:
-            instrs.append({"op" : "const", "dest" : self.iter_name, "type" : "int", "value" : 0})
-            term = self.bounds[0]
-        else:
-            instrs.append({"op" : "const", "dest" : self.iter_name, "type" : "int", "value" : self.bounds[0]})
-            term = self.bounds[1]
-
-        term_name = scope.next_reg()
-        instrs.append({"op" : "const", "dest" : term_name, "type" : "int", "value" : term})
-
-        inc_name = scope.next_reg()
-        instrs.append({"op" : "const", "dest" : inc_name, "type" : "int", "value" : 1})
-
-        instrs.append({"label" : entry_label})
-        cond = scope.next_reg()
-        instrs.append({"op" : "lt", "dest" : cond, "type" : "bool", "args" : [self.iter_name, term_name]})
-        instrs.append({"op" : "br", "labels" : [body_label, exit_label], "args" : [cond]})
-
-        instrs.append({"label" : body_label})
-        for stmt in self.block: instrs += stmt.get_instrs(scope)
-        instrs.append({"op" : "add", "dest" : self.iter_name, "type" : "int", "args" : [self.iter_name, inc_name]})
-        instrs.append({"op" : "jmp", "labels" : [entry_label]})
-
-        instrs.append({"label" : exit_label})
-        return instrs
+        for stmt in self.block: stmt.check_types(scope, errors)
+
+    def blocks(self):
+        return [self.block]
+
+    def build(self, builder):
+        """
+        Emits the loop tested at the bottom, so that an iteration runs one branch and no jump. The
+        bounds are constants, so whether the loop runs at all is known here and needs no test, and so
+        is its trip count, from which builder.unrolling, if set, decides how to unroll it (see
+        Unrolling); the body is built once to measure it, and that copy is the first emitted.
+        """
+        start, term = (0, self.bounds[0]) if len(self.bounds) == 1 else self.bounds
+        builder.add("const", self.iter_name, "int", value=start)
+        if start >= term:
+            return
+
+        inc_name = builder.next_reg()
+        builder.add("const", inc_name, "int", value=1)
+
+        first, reads = None, True
+        plan = [(1, term - start)]
+        if builder.unrolling is not None:
+            mark = len(builder.instrs)
+            for stmt in self.block: stmt.build(builder)
+            first = builder.instrs[mark:]
+            del builder.instrs[mark:]
+            reads = self.iter_name in block_vars(self.block)[0]
+            plan = builder.unrolling.plan(self, term - start, len(first), reads)
+
+        for copies, trips in plan:
+            start += copies * trips
+            step_name = inc_name
+            if not reads and copies > 1:
+                step_name = builder.next_reg()
+                builder.add("const", step_name, "int", value=copies)
+            if trips > 1:
+                label = builder.next_label()
+                body_label = f"body.{label}"
+                exit_label = f"exit.{label}"
+                end_name = builder.next_reg()
+                builder.add("const", end_name, "int", value=start)
+                builder.add_label(body_label)
+
+            for _ in range(copies):
+                if first is None:
+                    for stmt in self.block: stmt.build(builder)
+                else:
+                    builder.instrs += first
+                    first = None
+                if reads: builder.add("add", self.iter_name, "int", [self.iter_name, inc_name])
+            if not reads: builder.add("add", self.iter_name, "int", [self.iter_name, step_name])
+
+            if trips > 1:
+                cond = builder.next_reg()
+                builder.add("lt", cond, "bool", [self.iter_name, end_name])
+                builder.add("br", args=[cond], labels=[body_label, exit_label])
+                builder.add_label(exit_label)
 
 class WhileStmt(Stmt):
 
+    __slots__ = ("cond", "block")
+
     def __init__(self, cond : Expr, block: list[Stmt]):
         self.cond = cond
         self.block = block
@@ -229,28 +743,46 @@ class WhileStmt(Stmt):
     def __repr__(self):
         return f"WhileStmt(cond={self.cond}, block={self.block})"
 
-    def get_instrs(self, scope):
+    def check_types(self, scope, errors):
+        self.check_cond(self.cond, scope, errors)
+        for stmt in self.block: stmt.check_types(scope, errors)
+
+    def exprs(self):
+        return [self.cond]
 
-        label = scope.next_label()
+    def blocks(self):
+        return [self.block]
+
+    def build(self, builder):
+        """
+        Emits the loop tested at the bottom, behind a copy of the test that guards the first iteration,
+        so that an iteration runs the condition's branch but no jump back to a test at the top. A
+        condition longer than ROTATED_TEST_SIZE is emitted once, at the top.
+        """
+        label = builder.next_label()
         entry_label = f"entry.{label}"
         body_label = f"body.{label}"
         exit_label = f"exit.{label}"
 
-        instrs = [{"label" : entry_label}]
-        instrs += self.cond.get_instrs(scope)
-        cond = instrs[-1]["dest"]
-        instrs.append({"op" : "br", "labels" : [body_label, exit_label], "args" : [cond]})
+        rotated = len(self.cond.reverse_postorder()) <= ROTATED_TEST_SIZE
+        if not rotated:
+            builder.add_label(entry_label)
+        self.cond.build_branch(builder, body_label, exit_label)
 
-        instrs.append({"label" : body_label})
+        builder.add_label(body_label)
         for stmt in self.block:
-            instrs += stmt.get_instrs(scope)
+            stmt.build(builder)
 
-        instrs.append({"op" : "jmp", "labels" : [entry_label]})
-        instrs.append({"label" : exit_label})
-        return instrs
+        if rotated:
+            self.cond.build_branch(builder, body_label, exit_label)
+        else:
+            builder.add("jmp", labels=[entry_label])
+        builder.add_label(exit_label)
 
 class IfStmt(Stmt):
 
+    __slots__ = ("cond", "if_block", "elif_blocks", "else_block")
+
     def __init__(self, cond, if_block, elif_blocks, else_block):
         self.cond = cond
         self.if_block = if_block
@@ -260,138 +792,191 @@ class IfStmt(Stmt):
     def __repr__(self):
         return f"IfStmt(cond={self.cond}, if_block={self.if_block}, elif_blocks={self.elif_blocks}, else_block={self.else_block})"
 
-    def get_instrs(self, scope):
-        label = scope.next_label()
-        then_label = f"then.{label}"
-        else_label = f"else.{label}"
+    def check_types(self, scope, errors):
+        self.check_cond(self.cond, scope, errors)
+        for stmt in self.if_block: stmt.check_types(scope, errors)
+        for lcond, lblock in self.elif_blocks:
+            self.check_cond(lcond, scope, errors)
+            for stmt in lblock: stmt.check_types(scope, errors)
+        for stmt in self.else_block or []: stmt.check_types(scope, errors)
+
+    def exprs(self):
+        return [self.cond] + [lcond for lcond, _ in self.elif_blocks]
+
+    def blocks(self):
+        return [self.if_block] + [lblock for _, lblock in self.elif_blocks] + [self.else_block or []]
+
+    def build(self, builder):
+        """
+        Emits the branches one after another, each ending in a jump to the end unless it returns. A
+        condition not followed by another branch goes straight to the end when false.
+        """
+        label = builder.next_label()
         endif_label = f"endif.{label}"
+        branches = [(self.cond, self.if_block, f"then.{label}", f"else.{label}")]
+        for count, (lcond, lblock) in enumerate(self.elif_blocks, 1):
+            branches.append((lcond, lblock, f"then.{label}.{count}", f"else.{label}.{count}"))
 
-        instrs = self.cond.get_instrs(scope)
-        cond = instrs[-1]["dest"]
-
-        instrs.append({"op" : "br", "labels" : [then_label, else_label], "args" : [cond]})
-        instrs.append({"label" : then_label})
+        for i, (cond, block, then_label, else_label) in enumerate(branches):
+            last = i == len(branches) - 1 and not self.else_block
+            cond.build_branch(builder, then_label, endif_label if last else else_label)
+            builder.add_label(then_label)
+            for stmt in block: stmt.build(builder)
+            if last: break
+            if not builder.terminated(): builder.add("jmp", labels=[endif_label])
+            builder.add_label(else_label)
 
-        for stmt in self.if_block: instrs += stmt.get_instrs(scope)
-        instrs.append({"op" : "jmp", "labels" : [endif_label]})
+        for stmt in self.else_block or ():
+            stmt.build(builder)
 
-        instrs.append({"label" : else_label})
-
-        count = 1
-        for lcond, lblock in self.elif_blocks:
-            instrs += lcond.get_instrs(scope)
-            cond = instrs[-1]["dest"]
-            then_label = f"then.{label}.{count}"
-            else_label = f"else.{label}.{count}"
-            count += 1
-            instrs.append({"op" : "br", "labels" : [then_label, else_label], "args" : [cond]})
-            instrs.append({"label" : then_label})
-            for stmt in lblock: instrs += stmt.get_instrs(scope)
-            instrs.append({"op" : "jmp","labels" : [endif_label]})
-            instrs.append({"label" : else_label})
-
-        if self.else_block:
-            for stmt in self.else_block:
-                instrs += stmt.get_instrs(scope)
-
-        instrs.append({"label" : endif_label})
-        return instrs
+        builder.add_label(endif_label)
 
 class PassStmt(Stmt):
 
+    __slots__ = ()
+
     def __repr__(self):
         return f"PassStmt()"
 
+    def check_types(self, scope, errors):
+        pass
+
+    def build(self, builder):
+        pass
+
 class PrintStmt(Stmt):
 
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
         self.expr = expr
 
     def __repr__(self):
         return f"PrintStmt(expr={self.expr})"
 
-    def get_instrs(self, scope):
-        instrs = self.expr.get_instrs(scope)
-        arg = instrs[-1]["dest"]
-        instrs.append({"op" : "print", "args" : [arg]})
-        return instrs
+    def check_types(self, scope, errors):
+        self.check_value(self.expr, scope, errors)
+
+    def exprs(self):
+        return [self.expr]
+
+    def build(self, builder):
+        arg = self.expr.build(builder)
+        builder.add("print", args=[arg])
 
 class ReturnStmt(Stmt):
 
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
         self.expr = expr
 
     def __repr__(self):
         return f"ReturnStmt(expr={self.expr})"
 
-    def get_instrs(self, scope):
-        instrs = self.expr.get_instrs(scope)
-        arg = instrs[-1]["dest"]
-        instrs.append({"op" : "ret", "args" : [arg]})
-        return instrs
+    def check_types(self, scope, errors):
+        type = self.check_value(self.expr, scope, errors)
+        if type and type != scope.return_type:
+            expected = f"returns {scope.return_type}" if scope.return_type else "has no return type"
+            errors.append(scope.error(self.expr, f"returning {type} from a function that {expected}"))
+
+    def exprs(self):
+        return [self.expr]
+
+    def build(self, builder):
+        arg = self.expr.build(builder)
+        builder.add("ret", args=[arg])
 
 class AssignStmt(Stmt):
 
-    def __init__(self, dest, expr):
+    __slots__ = ("dest", "expr", "line", "col")
+
+    def __init__(self, dest, expr, line=0, col=0):
         self.dest = dest
         self.expr = expr
+        self.line = line # position of `dest`, as in Expr
+        self.col = col
 
     def __repr__(self):
         return f"AssignStmt(dest={self.dest}, expr={self.expr})"
 
-    def get_instrs(self, scope):
-        instrs = self.expr.get_instrs(scope)
-        arg = instrs[-1]["dest"]
-        instrs.append({"op" : "id", "dest" : self.dest, "type" : self.expr.get_type(scope), "args" : [arg]})
-        return instrs
+    def check_types(self, scope, errors):
+        type = self.check_value(self.expr, scope, errors)
+        dest_type = scope.get_type(self.dest)
+        if dest_type is None:
+            errors.append(scope.error(self, f"'{self.dest}' is not a variable"))
+        elif type and type != dest_type:
+            errors.append(scope.error(self, f"cannot assign {type} to '{self.dest}' of type {dest_type}"))
+
+    def exprs(self):
+        return [self.expr]
+
+    def build(self, builder):
+        arg = self.expr.build(builder)
+        builder.add("id", self.dest, self.expr.type, [arg])
 
 class ExprStmt(Stmt):
 
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
         self.expr = expr
 
     def __repr__(self):
         return f"ExprStmt(expr={self.expr})"
 
-    def get_instrs(self, scope):
-        return self.expr.get_instrs(scope)
+    def check_types(self, scope, errors):
+        self.expr.check_types(scope, errors)
+
+    def exprs(self):
+        return [self.expr]
+
+    def build(self, builder):
+        self.expr.build(builder)
 
 class VarDef(Ast):
 
-    def __init__(self, typed_var: TypedVar, literal: Literal):
-        assert typed_var.type == literal.type
+    __slots__ = ("name", "type", "init", "line", "col")
+
+    def __init__(self, typed_var: TypedVar, literal: Literal, line=0, col=0):
         self.name = typed_var.name
         self.type = typed_var.type
         self.init = literal.value
+        self.line = line # position of `name`, as in Expr
+        self.col = col
 
     def __repr__(self):
         return f"VarDef(name={self.name}, type={self.type}, init={self.init})"
 
-    def get_instr(self):
-        return {"op" : "const", "dest" : self.name, "type" : self.type, "value" : self.init}
+    def check_types(self, scope, errors):
+        init_type = "bool" if isinstance(self.init, bool) else "int"
+        if init_type != self.type:
+            errors.append(scope.error(self, f"cannot initialize '{self.name}' of type {self.type} with {init_type}"))
+
+    def build(self, builder):
+        builder.add("const", self.name, self.type, value=self.init)
 
 class Scope(object):
 
-    def __init__(self, type_map):
+    def __init__(self, type_map, return_type=None, line=0):
         self.type_map = type_map
-        self.reg = 1
-        self.label = 1
+        self.return_type = return_type
+        self.line = line # line of the function's 'def'
+
+    def error(self, node, msg) -> str:
+        """
+        Formats a type error at `node`, which has a position relative to the function (see Expr).
+        """
+        where = f" at line {self.line + node.line}, column {node.col}" if node.line else ""
+        return f"Type error{where}: {msg}"
 
     def get_type(self, name):
         return self.type_map.get(name)
 
-    def next_reg(self):
-        reg = f"v{self.reg}"
-        self.reg += 1
-        return reg
-
-    def next_label(self):
-        label = self.label
-        self.label += 1
-        return str(label)
-
 class FuncBody(Ast):
 
+    __slots__ = ("var_defs", "stmts")
+
     def __init__(self, var_defs: list[VarDef], stmts: list[Stmt]):
         self.var_defs = var_defs
         self.stmts = stmts
@@ -399,10 +984,9 @@ class FuncBody(Ast):
     def __repr__(self):
         return f"FuncBody(var_defs={self.var_defs}, stmts={self.stmts})"
 
-    def get_instrs(self, params, body, func_types):
+    def get_scope(self, params, func_types, return_type=None, line=0):
 
         type_map = {}
-        instrs = []
 
         for typed_def in params:
             type_map[typed_def.name] = typed_def.type
@@ -412,48 +996,101 @@ class FuncBody(Ast):
 
         for var_def in self.var_defs:
             type_map[var_def.name] = var_def.type
-            instrs.append(var_def.get_instr())
 
-        scope = Scope(type_map)
+        return Scope(type_map, return_type, line)
+
+    def check_types(self, params, func_types, return_type, line, errors):
+        scope = self.get_scope(params, func_types, return_type, line)
+
+        for var_def in self.var_defs:
+            var_def.check_types(scope, errors)
 
         for stmt in self.stmts:
-            instrs += stmt.get_instrs(scope)
+            stmt.check_types(scope, errors)
+
+    def build(self, builder):
+
+        for var_def in self.var_defs:
+            var_def.build(builder)
 
-        return instrs
+        for stmt in self.stmts:
+            stmt.build(builder)
 
 class FuncDef(Ast):
 
-    def __init__(self, name: str, params: list[TypedVar], type: str, body: FuncBody):
+    __slots__ = ("name", "params", "type", "body", "line")
+
+    def __init__(self, name: str, params: list[TypedVar], type: str, body: FuncBody, line=0):
         self.name = name
         self.params = params
         self.type = type
         self.body = body
+        self.line = line # line of the 'def', which positions in the body are relative to
 
     def __repr__(self):
         return f"FuncDef(name={self.name}, params={self.params}, type={self.type})"
 
-    def get_instrs(self, func_types):
-        instrs = self.body.get_instrs(self.params, self.body, func_types)
-        return instrs
-
-    def get_bril(self, func_types):
-        func = {"name" : self.name, "instrs" : self.get_instrs(func_types)}
-        if self.type: func["type"] = self.type
-        if self.params:
-            args = []
-            for typed_var in self.params:
-                args.append({"name" : typed_var.name, "type" : typed_var.type})
-            func["args"] = args
-        return func
+    def check_types(self, func_types, errors):
+        self.body.check_types(self.params, func_types, self.type, self.line, errors)
+
+    def build(self, fold=True, unrolling=None) -> FunctionBuilder:
+        """
+        Generates the function's instructions, from the types annotated by check_types, folding
+        constants in expressions if `fold` is set (see Expr.fold) and unrolling for loops as
+        `unrolling` decides, if given (see Unrolling).
+        """
+        builder = FunctionBuilder(fold, unrolling)
+        if unrolling is not None: unrolling.func = self.name
+        self.body.build(builder)
+        return builder
+
+    def get_function(self, fold=True, unrolling=None) -> Function:
+        """
+        Returns the function's generated code, not yet optimized.
+        """
+        args = [{"name" : typed_var.name, "type" : typed_var.type} for typed_var in self.params]
+        return Function(self.name, args, self.type, self.build(fold, unrolling).instrs)
+
+    def get_bril(self, fold=True, passes=(), unrolling=None):
+        """
+        Returns the function as Bril JSON, optimized by `passes` (see opt.py).
+        """
+        func = self.get_function(fold, unrolling)
+        optimize(func, passes)
+        return func.to_bril()
 
 class Program(Ast):
 
+    __slots__ = ("func_defs",)
+
     def __init__(self, func_defs: list[FuncDef]):
         self.func_defs = func_defs
 
     def __repr__(self):
         return f"Program(func_defs={self.func_defs})"
 
-    def get_bril(self):
+    def check_types(self, func_types):
+        """
+        Annotates every expression with its type, raising one exception listing every type error.
+        """
+        errors = []
+        for func_def in self.func_defs:
+            func_def.check_types(func_types, errors)
+        if errors:
+            raise Exception("\n".join(errors))
+
+    def get_bril(self, fold=True, passes=(), inlined=None, unrolling=None):
+        """
+        Returns the program as Bril JSON, its functions optimized by `passes`. If `inlined` is a list,
+        calls are inlined before the passes run and what was inlined is added to it (see
+        opt.inline_functions). For loops are unrolled as `unrolling` decides, if given.
+        """
         func_types = {func_def.name : func_def.type for func_def in self.func_defs}
-        return {"functions" : [func_def.get_bril(func_types) for func_def in self.func_defs]}
+        self.check_types(func_types)
+        if inlined is None:
+            return {"functions" : [func_def.get_bril(fold, passes, unrolling) for func_def in self.func_defs]}
+        funcs = [func_def.get_function(fold, unrolling) for func_def in self.func_defs]
+        inlined += inline_functions(funcs)
+        for func in funcs:
+            optimize(func, passes)
+        return {"functions" : [func.to_bril() for func in funcs]}
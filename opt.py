@@ -0,0 +1,1259 @@
+import sys
+import json
+import collections
+from bril import Instr, Label, Function
+from cfg import Block, basic_blocks, flatten, reachable, liveness, analyze
+from interp import VALUE_OPS
+
+"""
+Optimization passes. A pass optimizes one bril.Function, replacing its list of instructions and
+reusing and updating their records in place. optimize() runs the passes of PIPELINE in order.
+"""
+
+def count_names(instrs) -> tuple[collections.Counter, collections.Counter]:
+    """
+    Returns how many instructions define each variable, and how many times each variable is used as
+    an argument.
+    """
+    instrs = [instr for instr in instrs if isinstance(instr, Instr)]
+    defs = collections.Counter(instr.dest for instr in instrs if instr.dest is not None)
+    uses = collections.Counter(arg for instr in instrs if instr.args for arg in instr.args)
+    return defs, uses
+
+"""
+Copy propagation.
+
+Code generation copies every variable it reads into a fresh register, and the value of every
+assignment into its variable, so `u = u + 1` becomes
+
+    v1: int = id u; v2: int = const 1; v3: int = add v1 v2; u: int = id v3;
+
+coalesce_copies makes the instruction computing v3 write u directly, propagate_copies then reads u
+where v1 was read, and remove_dead_copies deletes the copy into v1, which is no longer used:
+
+    v2: int = const 1; u: int = add u v2;
+"""
+
+def coalescable_def(code, j, defs, uses) -> int | None:
+    """
+    For the copy `x = id t` at code[j], returns the position of t's first definition if t is defined
+    and used only from there up to the copy and nothing in between reads or writes x, so that t can be
+    renamed to x; returns None otherwise. Deleted instructions in `code` are None.
+    """
+    t, x = code[j].args[0], code[j].dest
+    t_defs, t_uses = 0, 1
+    for i in range(j - 1, -1, -1):
+        instr = code[i]
+        if instr is None: continue
+        if instr.dest == t:
+            t_defs += 1
+            if t_defs == defs[t]: # the first definition may read x, but not t
+                return i if t_uses == uses[t] and t not in (instr.args or ()) else None
+        if instr.dest == x or x in (instr.args or ()): return None
+        if instr.args: t_uses += instr.args.count(t)
+    return None
+
+def coalesce_copies(instrs) -> list[Instr | Label]:
+    """
+    Removes each copy `x = id t` whose temporary t can be renamed to x (see coalescable_def), making
+    the instructions that compute t compute x instead.
+    """
+    defs, uses = count_names(instrs)
+    blocks = basic_blocks(instrs)
+    for block in blocks:
+        code = block.instrs
+        # a cheap first test, as the walk back from a copy of a variable set early in a long block is
+        # slow: t is set and used only in this block, last at the copy (stale once copies are removed,
+        # which can only make it miss a copy)
+        block_defs, block_uses = count_names(code)
+        last_use = {arg : j for j, instr in enumerate(code) if instr.args for arg in instr.args}
+        for j, copy in enumerate(code):
+            if copy.op != "id" or copy.args[0] == copy.dest: continue
+            t = copy.args[0]
+            if block_defs[t] != defs[t] or block_uses[t] != uses[t] or last_use[t] != j: continue
+            i = coalescable_def(code, j, defs, uses)
+            if i is None: continue
+            x = copy.dest
+            for instr in code[i:j]:
+                if instr is None: continue
+                if instr.dest == t: instr.dest = x
+                if instr.args and t in instr.args: instr.args = [x if arg == t else arg for arg in instr.args]
+            code[j] = None
+            defs[x] += defs[t] - 1
+            uses[x] += uses[t] - 1
+            defs[t] = uses[t] = 0
+        block.instrs = [instr for instr in code if instr is not None]
+    return flatten(blocks)
+
+def copy_transfer(block, copies, rewrite=False) -> dict[str, str]:
+    """
+    Returns the copies available after `block` given those available before it, `copies`, as a map
+    from each copied variable to its source. With `rewrite`, also makes every instruction read the
+    source of each available copy instead of the copy, following copies of copies to the first source.
+    """
+    copies = dict(copies)
+    copied_from = collections.defaultdict(set) # source -> the variables holding a copy of it
+    for copy, source in copies.items():
+        copied_from[source].add(copy)
+    for instr in block.instrs:
+        if rewrite and instr.args and instr.op != "phi":
+            instr.args = [first_source(copies, arg) for arg in instr.args]
+        dest = instr.dest
+        if dest is None: continue
+        if dest in copies: copied_from[copies.pop(dest)].discard(dest)
+        for copy in copied_from.pop(dest, ()):
+            del copies[copy]
+        if instr.op == "id" and instr.args[0] != dest:
+            copies[dest] = instr.args[0]
+            copied_from[instr.args[0]].add(dest)
+    return copies
+
+def first_source(copies, var) -> str:
+    """
+    Returns the variable `var` is a copy of, of a copy of, and so on, among `copies`. A copy's source
+    never holds a copy made after it (writing a variable ends the copies of it), so this ends.
+    """
+    while var in copies: var = copies[var]
+    return var
+
+def propagate_copies(instrs) -> list[Instr | Label]:
+    """
+    Makes instructions read the source of a copy rather than the copy, wherever the copy is available:
+    on every path to the instruction the copy was made and neither variable has been written since.
+    Copies made earlier in the same block are found by copy_transfer alone; those made in other blocks
+    by solving the available-copies dataflow problem over the control-flow graph first.
+    """
+    blocks = basic_blocks(instrs)
+    entry = blocks[0]
+    _, live_out = liveness(blocks)
+    copies_out = {block : None for block in blocks} # None: not reached (yet), so no constraint on successors
+    worklist = collections.deque([entry])
+    queued = {entry}
+    while worklist:
+        block = worklist.popleft()
+        queued.discard(block)
+        copies_in = available_copies_in(block, entry, copies_out)
+        out = live_copies(copy_transfer(block, copies_in), live_out[block])
+        if out != copies_out[block]:
+            copies_out[block] = out
+            for succ in block.succs:
+                if succ not in queued:
+                    worklist.append(succ)
+                    queued.add(succ)
+    for block in blocks:
+        copy_transfer(block, available_copies_in(block, entry, copies_out), rewrite=True)
+    return flatten(blocks)
+
+def live_copies(copies, live) -> dict[str, str]:
+    """
+    Returns the copies among `copies` into the variables in `live`, and the copies their sources are,
+    in turn. A copy into a dead variable can no longer be read, so a block does not pass it on.
+    """
+    kept = {}
+    for copy in copies:
+        if copy not in live: continue
+        while copy in copies and copy not in kept:
+            kept[copy] = copies[copy]
+            copy = copies[copy]
+    return kept
+
+def available_copies_in(block, entry, copies_out) -> dict[str, str]:
+    if block is entry: # also entered from outside the function
+        return {}
+    copies = None
+    for pred in block.preds:
+        out = copies_out[pred]
+        if out is None: continue
+        copies = dict(out) if copies is None else {copy : source for copy, source in copies.items() if out.get(copy) == source}
+    return copies or {}
+
+def remove_dead_copies(instrs) -> list[Instr | Label]:
+    """
+    Deletes copies into variables that no instruction reads, until there are none left.
+    """
+    _, uses = count_names(instrs)
+    copies_into = collections.defaultdict(list)
+    for instr in instrs:
+        if isinstance(instr, Instr) and instr.op == "id":
+            copies_into[instr.dest].append(instr)
+    dead = [copy for dest, copies in copies_into.items() if uses[dest] == 0 for copy in copies]
+    removed = set()
+    while dead:
+        copy = dead.pop()
+        removed.add(id(copy))
+        source = copy.args[0]
+        uses[source] -= 1
+        if uses[source] == 0:
+            dead += copies_into[source]
+    return [instr for instr in instrs if id(instr) not in removed]
+
+def copy_propagation(func):
+    func.instrs = remove_dead_copies(propagate_copies(coalesce_copies(func.instrs)))
+
+"""
+Local value numbering.
+
+Within a block, every value an instruction computes gets a number, and so does every variable
+holding a value from before the block. An instruction whose operation and operand numbers match a
+value computed earlier is replaced by a copy of a variable still holding that value, one whose
+operands are all constants by the constant it computes, and every argument is read from the
+variable the value was first computed into.
+"""
+
+PURE_OPS = set(VALUE_OPS) - {"id"} # operations whose result depends on nothing but their operands
+COMMUTATIVE_OPS = {"add", "mul", "eq", "and", "or"}
+
+def fold_value(op, values) -> int | bool | None:
+    """
+    Returns the result of `op` on constant operands, as Bril computes it, or None if it traps.
+    """
+    if op == "div" and values[1] == 0:
+        return None
+    return VALUE_OPS[op](*values)
+
+class ValueTable(object):
+    """
+    The values known at a point of a block: the number of the value each variable stands for, and for
+    each number the value and the variables that hold it, the first of them its canonical home. A
+    variable renamed because it is written again later stands for the value its new name holds, while
+    itself still holding its old value.
+    """
+
+    __slots__ = ("var_nums", "held", "values", "homes", "nums")
+
+    def __init__(self):
+        self.var_nums = {} # variable -> number of the value it stands for
+        self.held = {} # variable -> number of the value it holds
+        self.values = [] # value number -> value: (op, type, operand numbers...), ("const", type, value), or None for an unknown
+        self.homes = [] # value number -> the variables holding it, as a dict used as an ordered set
+        self.nums = {} # value -> its number, for values still held by some variable
+
+    def num(self, var) -> int:
+        """
+        Returns the number of the value `var` stands for, numbering it as unknown if it comes from
+        before the block.
+        """
+        num = self.var_nums.get(var)
+        if num is None:
+            num = self.add(None)
+            self.assign(var, var, num)
+        return num
+
+    def add(self, value) -> int:
+        num = len(self.values)
+        self.values.append(value)
+        self.homes.append({})
+        if value is not None: self.nums[value] = num
+        return num
+
+    def home(self, num) -> str:
+        return next(iter(self.homes[num]))
+
+    def const(self, num) -> tuple | None:
+        value = self.values[num]
+        return value if value is not None and value[0] == "const" else None
+
+    def assign(self, var, dest, num):
+        """
+        Records that `var` stands for value `num` and that `dest`, `var` or its new name, now holds it.
+        A value no variable holds any more is forgotten.
+        """
+        old = self.held.get(dest)
+        if old is not None:
+            del self.homes[old][dest]
+            if not self.homes[old] and self.values[old] is not None:
+                del self.nums[self.values[old]]
+        self.held[dest] = num
+        self.homes[num][dest] = None
+        self.var_nums[var] = num
+
+def fresh_names(instrs, prefix) -> "Iterator[str]":
+    """
+    Yields names starting with `prefix` that no variable in `instrs` has.
+    """
+    taken = {name for instr in instrs if isinstance(instr, Instr) for name in [instr.dest, *(instr.args or ())]}
+    n = 0
+    while True:
+        n += 1
+        if f"{prefix}{n}" not in taken: yield f"{prefix}{n}"
+
+def number_values(block, names):
+    """
+    Numbers the values of `block` and rewrites it as described above, renaming to one of `names` each
+    variable written again later in the block, so that the value it holds in between stays available.
+    """
+    overwritten, seen = set(), set()
+    for instr in reversed(block.instrs):
+        if instr.dest is None: continue
+        if instr.dest in seen: overwritten.add(id(instr))
+        seen.add(instr.dest)
+
+    table = ValueTable()
+    for instr in block.instrs:
+        if instr.args and instr.op != "phi":
+            nums = [table.num(arg) for arg in instr.args]
+            instr.args = [table.home(num) for num in nums]
+        else:
+            nums = []
+        if instr.dest is None: continue
+
+        value = None
+        if instr.op == "const":
+            value = ("const", instr.type, instr.value)
+        elif instr.op == "id":
+            value = table.values[nums[0]]
+            if value is None or value[0] != "const": # a copy holds the same value under the same number
+                var = instr.dest
+                if id(instr) in overwritten: instr.dest = next(names)
+                table.assign(var, instr.dest, nums[0])
+                continue
+        elif instr.op in PURE_OPS:
+            consts = [table.const(num) for num in nums]
+            folded = fold_value(instr.op, [const[2] for const in consts]) if all(consts) else None
+            if folded is not None:
+                value = ("const", instr.type, folded)
+            else:
+                value = (instr.op, instr.type, *(sorted(nums) if instr.op in COMMUTATIVE_OPS else nums))
+
+        num = table.nums.get(value) if value is not None else None
+        if num is not None:
+            instr.op, instr.args, instr.value = "id", [table.home(num)], None
+        elif value is not None and value[0] == "const":
+            instr.op, instr.args, instr.value = "const", None, value[2]
+        var = instr.dest
+        if id(instr) in overwritten: instr.dest = next(names)
+        table.assign(var, instr.dest, num if num is not None else table.add(value))
+
+def local_value_numbering(func):
+    names = fresh_names(func.instrs, "lvn.")
+    blocks = basic_blocks(func.instrs)
+    for block in blocks:
+        number_values(block, names)
+    func.instrs = flatten(blocks)
+
+"""
+Dead code elimination.
+
+An instruction is dead if nothing it does is ever observed: it has no effect but setting its dest,
+and no path from it reads the dest before writing it again. call, print and the terminators are
+never removed, but a call whose result is dead no longer sets it. A div may trap, so it is only
+removed if its divisor is a known non-zero constant. A branch on a known constant becomes a jump,
+which can leave blocks unreachable; they are removed too.
+"""
+
+
+def known_constants(func) -> dict[str, tuple]:
+    """
+    Returns the variables every definition of which sets the same constant, mapped to (type, value);
+    parameters are never constant.
+    """
+    consts, varying = {}, set(func.params())
+    for instr in func.instrs:
+        if isinstance(instr, Label) or instr.dest is None or instr.dest in varying: continue
+        const = (instr.type, instr.value) if instr.op == "const" else None
+        if const is None or consts.setdefault(instr.dest, const) != const:
+            varying.add(instr.dest)
+            consts.pop(instr.dest, None)
+    return consts
+
+def fold_branches(instrs, consts) -> bool:
+    """
+    Turns each branch on a known constant, or to the same label both ways, into a jump. Returns True
+    if there were any.
+    """
+    folded = False
+    for instr in instrs:
+        if isinstance(instr, Instr) and instr.op == "br":
+            cond = consts.get(instr.args[0])
+            if cond is not None or instr.labels[0] == instr.labels[1]:
+                instr.op, instr.args, instr.labels = "jmp", None, [instr.labels[0 if cond is None or cond[1] else 1]]
+                folded = True
+    return folded
+
+def remove_dead_instrs(blocks, consts) -> bool:
+    """
+    Removes the dead instructions of `blocks`, walking each block backwards from the variables live out
+    of it. Returns True if there were any.
+    """
+    removed = False
+    _, live_out = liveness(blocks)
+    for block in blocks:
+        live = set(live_out[block])
+        kept = []
+        for instr in reversed(block.instrs):
+            dest = instr.dest
+            if dest is not None and dest not in live:
+                if instr.op == "call":
+                    instr.dest = instr.type = None
+                    removed = True
+                elif instr.op != "div" or consts.get(instr.args[1], (None, 0))[1] != 0:
+                    removed = True
+                    continue
+            if dest is not None: live.discard(dest)
+            live.update(instr.args or ())
+            kept.append(instr)
+        kept.reverse()
+        block.instrs = kept
+    return removed
+
+def dead_code_elimination(func):
+    """
+    Removes dead instructions and unreachable blocks until there are none left, as each removal can
+    make more code dead.
+    """
+    changed = True
+    while changed:
+        consts = known_constants(func)
+        changed = fold_branches(func.instrs, consts)
+        blocks = basic_blocks(func.instrs)
+        live_blocks = reachable(blocks)
+        changed |= len(live_blocks) < len(blocks)
+        if len(live_blocks) < len(blocks):
+            blocks = basic_blocks(flatten(live_blocks))
+        changed |= remove_dead_instrs(blocks, consts)
+        func.instrs = flatten(blocks)
+
+"""
+Static single assignment form.
+
+to_ssa gives every variable one definition per name: each definition writes a new version of its
+variable, and where versions from different predecessors meet, a phi picks the one for the edge
+control came in on. Phis go at the iterated dominance frontiers of a variable's definitions, and only
+where the variable is live, so no dead phis are made. from_ssa turns each phi back into copies at the
+end of its predecessors, so that the result runs without phi support, and gives a copy's two
+variables one name where their values are never needed at once, which removes the copy.
+
+    .entry.4:                  .entry.4:
+                               u.2: int = phi u.1 u.6 .exit.3 .body.4;
+    v29: int = id u;           v29.1: int = id u.2;
+"""
+
+UNDEFINED = "__undefined" # the argument of a phi for an edge along which its variable is not yet set
+
+def label_blocks(func) -> list[Block]:
+    """
+    Returns the reachable blocks of `func`, giving every block a label, so that phis can name it, and
+    the function a new empty entry block if the entry has predecessors, so that it has no phis.
+    """
+    labels = fresh_labels(func.instrs, "ssa.")
+    blocks = reachable(basic_blocks(func.instrs))
+    instrs = [Label(next(labels))] if blocks[0].preds else []
+    for block in blocks:
+        instrs.append(block.label or Label(next(labels)))
+        instrs += block.instrs
+    return basic_blocks(instrs)
+
+def fresh_labels(instrs, prefix) -> "Iterator[str]":
+    """
+    Yields names starting with `prefix` that no label in `instrs` has.
+    """
+    taken = {instr.name for instr in instrs if isinstance(instr, Label)}
+    n = 0
+    while True:
+        n += 1
+        if f"{prefix}{n}" not in taken: yield f"{prefix}{n}"
+
+def place_phis(func, blocks) -> dict[str, dict[str, Instr]]:
+    """
+    Returns the phis `blocks` need, by block name and variable, without their arguments yet.
+    """
+    frontier = analyze(func, blocks).frontier()
+    live_in, _ = liveness(blocks)
+    types = {arg["name"] : arg["type"] for arg in func.args}
+    sites = collections.defaultdict(set, {param : {blocks[0].name} for param in types})
+    for block in blocks:
+        for instr in block.instrs:
+            if instr.dest is not None:
+                sites[instr.dest].add(block.name)
+                types[instr.dest] = instr.type
+
+    by_name = {block.name : block for block in blocks}
+    phis = {block.name : {} for block in blocks}
+    for var, names in sites.items():
+        merges, worklist = set(), list(names)
+        while worklist:
+            for name in frontier[worklist.pop()]:
+                if name not in merges:
+                    merges.add(name)
+                    worklist.append(name)
+        for name in merges: # a phi where the variable is dead would be dead too
+            if var in live_in[by_name[name]]:
+                phis[name][var] = Instr("phi", var, types[var], [], labels=[])
+    return phis
+
+def to_ssa(func):
+    """
+    Converts `func` to SSA form, renaming the definitions of each variable v to v.1, v.2, ... in a walk
+    of the dominator tree, which sees every definition before the uses it reaches. Parameters keep
+    their names.
+    """
+    blocks = label_blocks(func)
+    phis = place_phis(func, blocks)
+    tree = analyze(func, blocks).dom_tree()
+    by_name = {block.name : block for block in blocks}
+    taken = {name for instr in func.instrs if isinstance(instr, Instr) for name in [instr.dest, *(instr.args or ())]} | set(func.params())
+    versions = collections.Counter()
+    stacks = collections.defaultdict(list, {param : [param] for param in func.params()}) # the version each variable holds
+
+    def define(var) -> str:
+        while True:
+            versions[var] += 1
+            name = f"{var}.{versions[var]}"
+            if name not in taken: break
+        taken.add(name)
+        stacks[var].append(name)
+        return name
+
+    walk = [(blocks[0].name, None)]
+    while walk:
+        name, defined = walk.pop()
+        if defined is not None: # leaving the block's subtree
+            for var in defined: stacks[var].pop()
+            continue
+        block, defined = by_name[name], []
+        for var, phi in phis[name].items():
+            phi.dest = define(var)
+            defined.append(var)
+        for instr in block.instrs:
+            if instr.args: instr.args = [stacks[arg][-1] if stacks[arg] else arg for arg in instr.args]
+            if instr.dest is not None:
+                var = instr.dest
+                instr.dest = define(var)
+                defined.append(var)
+        for succ in block.succs:
+            for var, phi in phis[succ.name].items():
+                phi.args.append(stacks[var][-1] if stacks[var] else UNDEFINED)
+                phi.labels.append(block.label.name)
+        walk.append((name, defined))
+        walk.extend((child, None) for child in reversed(tree[name]))
+
+    for block in blocks:
+        block.instrs = list(phis[block.name].values()) + block.instrs
+    func.instrs = flatten(blocks)
+
+def sequence_copies(copies, temps) -> list[Instr]:
+    """
+    Returns instructions making the copies `copies`, (dest, source, type) triples, as if all at once:
+    each copy comes before those overwriting its source, and a cycle of copies, as when two phis swap
+    their variables, is broken by first saving one variable to a temporary from `temps`.
+    """
+    pending = {dest : (source, type) for dest, source, type in copies if dest != source}
+    instrs = []
+    while pending:
+        read = {source for source, _ in pending.values()}
+        ready = [dest for dest in pending if dest not in read]
+        for dest in ready:
+            source, type = pending.pop(dest)
+            instrs.append(Instr("id", dest, type, [source]))
+        if not ready: # the rest are cycles
+            dest, (_, type) = next(iter(pending.items()))
+            temp = next(temps)
+            instrs.append(Instr("id", temp, type, [dest]))
+            pending = {d : (temp if source == dest else source, t) for d, (source, t) in pending.items()}
+    return instrs
+
+def interference(blocks, params, names) -> dict[str, set[str]]:
+    """
+    Returns the variables each of `names` interferes with: is live where the other is written, so
+    that the two cannot share a name. A copy's destination does not interfere with its source, as
+    they hold the same value, nor with the other copies of the source made before it in its block
+    that still hold it. Parameters interfere with whatever is live at the entry.
+    """
+    live_in, live_out = liveness(blocks)
+    graph = collections.defaultdict(set)
+
+    def interfere(dest, live, same=()):
+        for var in live:
+            if var != dest and var not in same and (dest in names or var in names):
+                graph[dest].add(var)
+                graph[var].add(dest)
+
+    for param in params:
+        interfere(param, live_in[blocks[0]] | set(params))
+    for block in blocks:
+        same = {} # id of a copy -> its source and the variables holding a copy of the source before it
+        copies_of, source_of = collections.defaultdict(set), {}
+        for instr in block.instrs:
+            if instr.op == "id": same[id(instr)] = {instr.args[0], *copies_of[instr.args[0]]}
+            if instr.dest is None: continue
+            copies_of.pop(instr.dest, None)
+            if instr.dest in source_of: copies_of[source_of.pop(instr.dest)].discard(instr.dest)
+            if instr.op == "id":
+                copies_of[instr.args[0]].add(instr.dest)
+                source_of[instr.dest] = instr.args[0]
+        live = set(live_out[block])
+        for instr in reversed(block.instrs):
+            if instr.dest is not None:
+                interfere(instr.dest, live, same.get(id(instr), ()))
+                live.discard(instr.dest)
+            live.update(instr.args or ())
+    return graph
+
+def merge_copies(blocks, copies, params):
+    """
+    Gives the source and destination of each of `copies` one name, unless they interfere, and removes
+    the copies that become copies of a variable into itself.
+    """
+    graph = interference(blocks, params, {name for copy in copies for name in (copy.dest, *copy.args)})
+    names = {} # merged variable -> the name it was merged into
+
+    def find(var):
+        while var in names: var = names[var]
+        return var
+
+    for copy in copies:
+        dest, source = find(copy.dest), find(copy.args[0])
+        if dest == source or source in graph[dest] or (dest in params and source in params): continue
+        if source in params: dest, source = source, dest # a parameter keeps its name
+        names[source] = dest
+        graph[dest] |= graph[source]
+        for var in graph.pop(source, ()):
+            graph[var].add(dest)
+
+    for block in blocks:
+        for instr in block.instrs:
+            if instr.dest is not None: instr.dest = find(instr.dest)
+            if instr.args: instr.args = [find(arg) for arg in instr.args]
+        block.instrs = [instr for instr in block.instrs if instr.op != "id" or instr.args[0] != instr.dest]
+
+def from_ssa(func, merge=True):
+    """
+    Replaces each phi of `func` by copies of its arguments at the end of its predecessors, then, with
+    `merge`, merges the variables the copies are between where it can, which removes most of them. The copies for an
+    edge out of a block that branches go in a new block on the edge instead if they would overwrite a
+    variable the branch reads or the other way may read.
+    """
+    blocks = basic_blocks(func.instrs)
+    by_label = {block.label.name : block for block in blocks if block.label}
+    live_in, _ = liveness(blocks)
+    edges = collections.defaultdict(dict) # (pred, succ) -> {dest : (dest, source, type)}
+    for block in blocks:
+        for phi in block.instrs:
+            if phi.op != "phi": continue
+            for arg, label in zip(phi.args, phi.labels):
+                pred = by_label.get(label)
+                if pred is not None and arg != UNDEFINED and block in pred.succs:
+                    edges[pred, block].setdefault(phi.dest, (phi.dest, arg, phi.type))
+        block.instrs = [instr for instr in block.instrs if instr.op != "phi"]
+
+    temps = fresh_names(func.instrs, "ssa.")
+    labels = fresh_labels(func.instrs, "ssa.")
+    copies = []
+    split = {} # pred -> the blocks to place after it, on edges out of it
+    for (pred, succ), edge_copies in edges.items():
+        instrs = sequence_copies(edge_copies.values(), temps)
+        copies += instrs
+        terminator = pred.terminator()
+        dests = set(edge_copies)
+        if terminator is not None and (dests & set(terminator.args or ()) or any(other is not succ and dests & live_in[other] for other in pred.succs)):
+            label = Label(next(labels))
+            terminator.labels = [label.name if name == succ.label.name else name for name in terminator.labels]
+            edge = Block(label.name, label)
+            edge.instrs = instrs + [Instr("jmp", labels=[succ.label.name])]
+            edge.succs, edge.preds = [succ], [pred]
+            pred.succs = [edge if other is succ else other for other in pred.succs]
+            succ.preds = [edge if other is pred else other for other in succ.preds]
+            split.setdefault(pred, []).append(edge)
+        elif terminator is not None:
+            pred.instrs[-1:-1] = instrs
+        else:
+            pred.instrs += instrs
+
+    placed = []
+    for block in blocks:
+        placed.append(block)
+        placed += split.get(block, [])
+    if merge: merge_copies(placed, copies, func.params())
+
+    for pred, edges in split.items(): # edges left with nothing but their jump need not be there
+        for edge in edges:
+            if len(edge.instrs) == 1:
+                terminator = pred.terminator()
+                terminator.labels = [edge.instrs[0].labels[0] if name == edge.name else name for name in terminator.labels]
+                placed.remove(edge)
+    func.instrs = flatten(placed)
+
+"""
+Loop-invariant code motion.
+
+An instruction computes the same value on every iteration of a loop if nothing in the loop writes
+its arguments. Those that cannot trap and have effects only on their own variable are moved to a
+preheader, a block placed before the loop's header that every entry into the loop goes through, so
+that they run once rather than on every iteration:
+
+    br v3 .body.1 .exit.1;     br v3 .preheader.1 .exit.1;
+                               .preheader.1:
+                               v11: int = const 1;
+    .body.1:                   .body.1:
+      ...                        ...
+    .endif.2:                  .endif.2:
+    v11: int = const 1;
+    div: int = add div v11;    div: int = add div v11;
+    v15: bool = lt div x;      v15: bool = lt div x;
+    br v15 .body.1 .exit.1;    br v15 .body.1 .exit.1;
+"""
+
+HOISTABLE_OPS = set(VALUE_OPS) | {"const"}
+
+def add_preheaders(blocks, loops, labels) -> dict[str, Block | Label]:
+    """
+    Finds or makes a preheader for each of `loops` whose header is not entered by falling through from
+    inside the loop. A block that is the only way into the loop from outside and falls through to the
+    header serves as it is; otherwise the jumps into the loop from outside are sent to a new, empty
+    preheader, to be placed right before the header. Returns the name of each loop's header mapped to
+    its preheader, a block or the label of a new one.
+    """
+    loops = {loop.header : loop for loop in loops}
+    preheaders = {}
+    for i, block in enumerate(blocks):
+        loop = loops.get(block.name)
+        if loop is None or block.label is None: continue
+        prev = blocks[i - 1] if i > 0 else None
+        if prev is not None and prev.terminator() is None:
+            if prev.name in loop.body: continue
+            if [pred for pred in block.preds if pred.name not in loop.body] == [prev]:
+                preheaders[block.name] = prev
+                continue
+        preheader = Label(next(labels))
+        for pred in block.preds:
+            terminator = pred.terminator()
+            if pred.name not in loop.body and terminator is not None:
+                terminator.labels = [preheader.name if name == block.name else name for name in terminator.labels]
+        preheaders[block.name] = preheader
+    return preheaders
+
+def hoist_invariants(body, preheader, outside, consts):
+    """
+    Moves the instructions of `body`, the blocks of a loop in reverse postorder, that compute the same
+    value on every iteration and cannot trap to the end of `preheader`, if their variable is not read
+    before being written in the loop nor read after it, `outside`.
+    """
+    defs = collections.Counter(instr.dest for block in body for instr in block.instrs if instr.dest is not None)
+    for block in body:
+        kept = []
+        for instr in block.instrs:
+            if (instr.op in HOISTABLE_OPS and defs[instr.dest] == 1 and instr.dest not in outside
+                    and not any(defs[arg] for arg in instr.args or ())
+                    and (instr.op != "div" or consts.get(instr.args[1], (None, 0))[1] != 0)):
+                preheader.instrs.append(instr)
+                defs[instr.dest] = 0
+            else:
+                kept.append(instr)
+        block.instrs = kept
+
+def with_preheaders(func) -> tuple[list[Block], dict[str, Block], set[str]]:
+    """
+    Returns the blocks of `func` with the preheaders of add_preheaders in place, the preheader of each
+    loop by the name of its header, and the names of the preheaders that are new.
+    """
+    blocks = basic_blocks(func.instrs)
+    preheaders = add_preheaders(blocks, analyze(func, blocks).loops(), fresh_labels(func.instrs, "preheader."))
+    new = {header : preheader for header, preheader in preheaders.items() if isinstance(preheader, Label)}
+    if new:
+        instrs = []
+        for block in blocks:
+            if block.name in new: instrs.append(new[block.name])
+            if block.label: instrs.append(block.label)
+            instrs += block.instrs
+        blocks = basic_blocks(instrs)
+    by_name = {block.name : block for block in blocks}
+    return blocks, {header : by_name[preheader.name] for header, preheader in preheaders.items()}, {label.name for label in new.values()}
+
+def remove_empty_preheaders(func, blocks, new):
+    """
+    Sets the instructions of `func` to those of `blocks`, leaving out the new preheaders, named in
+    `new`, that nothing was put in, and sending the jumps to them to their loop's header again.
+    """
+    empty = {block.name : block.succs[0].name for block in blocks if block.name in new and not block.instrs}
+    for block in blocks:
+        terminator = block.terminator()
+        if terminator is not None and terminator.labels:
+            terminator.labels = [empty.get(name, name) for name in terminator.labels]
+    func.instrs = flatten(block for block in blocks if block.name not in empty)
+
+def loop_invariant_code_motion(func):
+    consts = known_constants(func)
+    blocks, preheaders, new = with_preheaders(func)
+    if not preheaders: return
+    by_name = {block.name : block for block in blocks}
+    analysis = analyze(func, blocks)
+    live_in, _ = liveness(blocks)
+
+    for loop in analysis.loops(): # innermost first, so what leaves an inner loop can leave the outer one too
+        if loop.header not in preheaders: continue
+        body = [by_name[name] for name in analysis.order() if name in loop.body]
+        outside = live_in[by_name[loop.header]].union(*(live_in[by_name[name]] for name in loop.exits(analysis)))
+        hoist_invariants(body, preheaders[loop.header], outside, consts)
+    remove_empty_preheaders(func, blocks, new)
+
+"""
+Strength reduction.
+
+Replaces operations by cheaper ones that compute the same value for all operands, negative ones
+included. Bril has no shifts or bitwise operations, so a division or remainder by a power of two stays
+a div; what can go is the arithmetic around it and multiplications:
+
+    x % c == 0:  t = div x c; m = mul t c; r = sub x m; b = eq r 0  ->  t = div x c; m = mul t c; b = eq m x
+    x * 0 -> 0;  x * 1, x // 1 -> x;  x * 2 -> x + x;  x * -1, x // -1, -x -> 0 - x
+
+The first holds however div rounds, as x - m is 0 exactly when m is x. In a loop, the product of an
+induction variable and a constant is kept in a variable of its own, which an addition updates where
+the induction variable is, so that the loop does no multiplication (see reduce_induction_products).
+"""
+
+def int_const(consts, var) -> int | None:
+    const = consts.get(var)
+    return const[1] if const is not None and const[0] == "int" else None
+
+def reduce_product(instr, consts, defs, uses, const_defs):
+    """
+    Rewrites `instr`, a mul or div, if it multiplies or divides by a constant it need not.
+    """
+    a, b = instr.args
+    if instr.op == "mul" and int_const(consts, b) is None: a, b = b, a
+    value = int_const(consts, b)
+    if value == 1:
+        instr.op, instr.args = "id", [a]
+    elif value == 0 and instr.op == "mul":
+        instr.op, instr.args, instr.value = "const", None, 0
+    elif value == 2 and instr.op == "mul":
+        instr.op, instr.args = "add", [a, a]
+    elif value == -1 and defs[b] == uses[b] == 1 and b in const_defs: # the -1 serves only here, so it can be a 0
+        const_defs[b].value = 0
+        instr.op, instr.args = "sub", [b, a]
+
+def reduce_operations(func):
+    """
+    Makes the rewrites above other than those of induction variables.
+    """
+    consts = known_constants(func)
+    defs, uses = count_names(func.instrs)
+    const_defs = {instr.dest : instr for instr in func.instrs if isinstance(instr, Instr) and instr.op == "const"}
+    blocks = basic_blocks(func.instrs)
+    for block in blocks:
+        subs = {} # variable -> the sub computing it, while its operands keep their values
+        readers = collections.defaultdict(set) # variable -> the variables in subs computed from it
+        removed = set()
+        for instr in block.instrs:
+            if instr.op == "eq":
+                r, zero = instr.args
+                if int_const(consts, r) == 0: r, zero = zero, r
+                sub = subs.get(r)
+                if sub is not None and uses[r] == 1 and int_const(consts, zero) == 0:
+                    instr.args = list(sub.args)
+                    removed.add(id(sub))
+            elif instr.op in {"mul", "div"}:
+                reduce_product(instr, consts, defs, uses, const_defs)
+            dest = instr.dest
+            if dest is None: continue
+            subs.pop(dest, None)
+            for var in readers.pop(dest, ()):
+                subs.pop(var, None)
+            if instr.op == "sub" and defs[dest] == 1 and dest not in instr.args:
+                subs[dest] = instr
+                for arg in instr.args: readers[arg].add(dest)
+        block.instrs = [instr for instr in block.instrs if id(instr) not in removed]
+    func.instrs = flatten(blocks)
+
+def reduce_induction_products(func):
+    """
+    Replaces each product i * k in a loop, where k is a constant and i an induction variable of the
+    loop, one the loop writes only by adding or subtracting a constant s, by a copy of a new variable
+    p. The preheader sets p to i * k, and p changes by s * k right after each change of i.
+    """
+    consts = known_constants(func)
+    blocks, preheaders, new = with_preheaders(func)
+    if not preheaders: return
+    by_name = {block.name : block for block in blocks}
+    analysis = analyze(func, blocks)
+    live_in, _ = liveness(blocks)
+    names = fresh_names(func.instrs, "sr.")
+
+    for loop in analysis.loops():
+        if loop.header not in preheaders: continue
+        body = [by_name[name] for name in analysis.order() if name in loop.body]
+        defs = collections.Counter(instr.dest for block in body for instr in block.instrs if instr.dest is not None)
+        steps = {} # induction variable -> (the instruction changing it, the constant it adds or subtracts)
+        for block in body:
+            for instr in block.instrs:
+                if instr.op not in {"add", "sub"} or defs[instr.dest] != 1 or instr.dest not in live_in[by_name[loop.header]]: continue
+                a, b = instr.args
+                if instr.op == "add" and b == instr.dest: a, b = b, a
+                if a == instr.dest and int_const(consts, b) is not None:
+                    steps[a] = (instr, int_const(consts, b))
+
+        products = {} # (induction variable, constant) -> the variable holding their product
+        updates = collections.defaultdict(list) # id of an instruction changing an induction variable -> what follows it
+        for block in body:
+            for instr in block.instrs:
+                if instr.op != "mul": continue
+                i, k = instr.args
+                if i not in steps: i, k = k, i
+                factor = int_const(consts, k)
+                if i not in steps or factor is None: continue
+                product = products.get((i, factor))
+                if product is None:
+                    product, factor_var, step_var = next(names), next(names), next(names)
+                    change, step = steps[i]
+                    preheaders[loop.header].instrs += [Instr("const", factor_var, "int", value=factor),
+                                                      Instr("mul", product, "int", [i, factor_var]),
+                                                      Instr("const", step_var, "int", value=VALUE_OPS["mul"](step, factor))]
+                    updates[id(change)].append(Instr(change.op, product, "int", [product, step_var]))
+                    products[i, factor] = product
+                instr.op, instr.args = "id", [product]
+        for block in body:
+            if any(id(instr) in updates for instr in block.instrs):
+                block.instrs = [instr for change in block.instrs for instr in [change, *updates.get(id(change), ())]]
+    remove_empty_preheaders(func, blocks, new)
+
+def strength_reduction(func):
+    reduce_operations(func)
+    reduce_induction_products(func)
+
+"""
+Tail-call elimination.
+
+A call a function makes to itself just before returning what the call returns, `v = call @f a b;
+ret v`, need not run in a frame of its own: the function can set its parameters to the arguments,
+all at once as the arguments may read them, and start again, so that the recursion becomes a loop.
+Calls whose value is added to or multiplied by another before it is returned, as in `return 2 *
+gcd1(u // 2, v // 2)`, are turned into loops too, if all of them use the same operation: the other
+value is accumulated in a variable, which every return then combines with the value it returns.
+Both operations wrap, so they are associative and commutative, and that gives the same result.
+"""
+
+ACCUMULATOR_IDENTITIES = {"add" : 0, "mul" : 1}
+
+def tail_call(block, i, func) -> tuple[str | None, str | None] | None:
+    """
+    If the instruction at `i` in `block` is a call of `func` by itself in tail position, returns the
+    operation combining its value with another before it is returned and that other variable, or
+    (None, None) if it is returned as it is; otherwise returns None.
+    """
+    call, rest = block.instrs[i], block.instrs[i + 1:]
+    if call.op != "call" or call.funcs[0] != func.name: return None
+    if call.dest is None: # returning nothing, or falling off the end of the function
+        returns = [instr.op for instr in rest] == ["ret"] and not rest[0].args or not rest and not block.succs
+        return (None, None) if returns else None
+    if [instr.op for instr in rest] == ["ret"] and rest[0].args == [call.dest]:
+        return None, None
+    if len(rest) != 2 or rest[0].op not in ACCUMULATOR_IDENTITIES or rest[1].op != "ret" or rest[1].args != [rest[0].dest]: return None
+    operands = [arg for arg in rest[0].args if arg != call.dest]
+    return (rest[0].op, operands[0]) if len(operands) == 1 else None
+
+def tail_call_elimination(func):
+    blocks = basic_blocks(func.instrs)
+    sites = [] # (block, position of the call, operation, operand)
+    for block in blocks:
+        for i in range(len(block.instrs)):
+            site = tail_call(block, i, func)
+            if site is not None: sites.append((block, i, *site))
+    accumulate = next((op for _, _, op, _ in sites if op is not None), None) # the one operation accumulated with
+    sites = [site for site in sites if site[2] in (None, accumulate)]
+    if not sites: return
+    names = fresh_names(func.instrs, "tail.")
+    start = next(fresh_labels(func.instrs, "start."))
+    acc = next(names) if accumulate else None
+    params = [(arg["name"], arg["type"]) for arg in func.args]
+
+    for block, i, op, operand in sites:
+        call = block.instrs[i]
+        update = [Instr(op, acc, "int", [acc, operand])] if op else []
+        copies = sequence_copies([(param, arg, type) for (param, type), arg in zip(params, call.args or ())], names)
+        block.instrs[i:] = update + copies + [Instr("jmp", labels=[start])]
+    if acc:
+        for block in blocks:
+            ret = block.terminator()
+            if ret is None or ret.op != "ret" or not ret.args: continue
+            result = next(names)
+            block.instrs[-1:] = [Instr(accumulate, result, "int", [acc, ret.args[0]]), Instr("ret", args=[result])]
+    init = [Instr("const", acc, "int", value=ACCUMULATOR_IDENTITIES[accumulate])] if acc else []
+    func.instrs = init + [Label(start)] + flatten(blocks)
+
+"""
+Control-flow cleanup.
+
+Code generation and the passes above leave jumps that do no work: a jump to the block right after
+it, a branch or jump to an empty block or one holding just a jump, and labels only ever reached by
+falling through, which split straight-line code into blocks. simplify_cfg sends jumps where they
+end up going, places a block reached by one jump alone right after that jump, and then drops the
+jumps to the next block and the labels nothing jumps to:
+
+    br v3 .then.2 .else.2;       br v3 .then.2 .endif.2;
+    .then.2:                     .then.2:
+    v2: bool = const false;      v2: bool = const false;
+    jmp .endif.2;
+    .else.2:
+    .endif.2:                    .endif.2:
+"""
+
+def branch_taken(block, branch) -> str | None:
+    """
+    Returns the label `branch` goes to if `block` ends by setting its condition to a constant, and
+    None if the condition is not known there.
+    """
+    for instr in reversed(block.instrs):
+        if instr.dest == branch.args[0]:
+            return branch.labels[0 if instr.value else 1] if instr.op == "const" else None
+    return None
+
+def thread_jumps(blocks) -> bool:
+    """
+    Makes each jump or branch to an empty block, or to one holding just a jump, go where that block
+    leads, and a jump to a block holding just a branch on a constant the jumping block set go where
+    the branch would. A branch with the same label both ways, or on a constant set in its own block,
+    becomes a jump. Returns True if any changed.
+    """
+    by_name = {block.name : block for block in blocks}
+    forward = {} # block name -> where a jump to it may go instead
+    for i, block in enumerate(blocks):
+        if not block.instrs and i + 1 < len(blocks):
+            forward[block.name] = blocks[i + 1].name
+        elif len(block.instrs) == 1 and block.instrs[0].op == "jmp":
+            forward[block.name] = block.instrs[0].labels[0]
+
+    changed = False
+    for block in blocks:
+        jump = block.terminator()
+        if jump is None or jump.op == "ret": continue
+        labels = []
+        for name in jump.labels:
+            seen = set() # a loop of jumps has no end to send jumps to
+            while name in forward and name not in seen:
+                seen.add(name)
+                name = forward[name]
+            labels.append(name)
+        if labels != jump.labels:
+            jump.labels = labels
+            changed = True
+        taken = branch_taken(block, jump) if jump.op == "br" else None
+        if jump.op == "br" and (labels[0] == labels[1] or taken is not None):
+            jump.op, jump.args, jump.labels = "jmp", None, [taken or labels[0]]
+            changed = True
+        target = by_name[jump.labels[0]]
+        if jump.op == "jmp" and len(target.instrs) == 1 and target.instrs[0].op == "br" and target is not block:
+            taken = branch_taken(block, target.instrs[0])
+            if taken is not None:
+                jump.labels = [taken]
+                changed = True
+    return changed
+
+def lay_out(blocks) -> list[Block]:
+    """
+    Returns `blocks` in a new order, where each block only entered by a jump from another block follows
+    that block if it ends in a terminator of its own, so that moving it needs no new jump.
+    """
+    by_name = {block.name : block for block in blocks}
+    order, placed = [], set()
+    for block in blocks:
+        while block is not None and block.name not in placed:
+            order.append(block)
+            placed.add(block.name)
+            jump = block.terminator()
+            succ = by_name[jump.labels[0]] if jump is not None and jump.op == "jmp" else None
+            if succ is None or succ is blocks[0] or succ.preds != [block] or succ.terminator() is None: break
+            block = succ
+    return order
+
+def simplify_cfg(func):
+    if any(isinstance(instr, Instr) and instr.op == "phi" for instr in func.instrs): return # phis name their predecessors
+    changed = True
+    while changed:
+        blocks = basic_blocks(flatten(reachable(basic_blocks(func.instrs))))
+        changed = thread_jumps(blocks)
+        blocks = lay_out(basic_blocks(flatten(reachable(blocks))))
+        instrs = []
+        for i, block in enumerate(blocks):
+            prev = blocks[i - 1] if i > 0 else None
+            if block.label and prev is not None and block.preds == [prev] and prev.terminator() is None:
+                changed = True # only entered by falling through: no label needed
+            elif block.label:
+                instrs.append(block.label)
+            instrs += block.instrs
+            jump = block.terminator()
+            if jump is not None and jump.op == "jmp" and i + 1 < len(blocks) and jump.labels[0] == blocks[i + 1].name:
+                instrs.pop()
+                changed = True
+                block.instrs = block.instrs[:-1] # so the next block sees this one fall through
+        func.instrs = instrs
+
+"""
+Inlining.
+
+Unlike the passes above, inlining works on all the functions of a program at once: inline_functions
+replaces calls to small functions by the instructions of the function called, so that a loop calling
+one no longer pays for the call and the return, and the passes see the caller and callee together.
+The body is copied with its variables and labels renamed apart from the caller's, a copy into each
+parameter before it, and each return made a copy into the call's destination and a jump past the
+body. A function calling itself, directly or through others, is never inlined.
+"""
+
+INLINE_SIZE = 40 # the largest function, in instructions, inline_functions copies into its callers
+
+class Inlined(object):
+    """
+    What inline_functions did for one pair of caller and callee.
+    """
+
+    __slots__ = ("caller", "callee", "sites", "size", "jumps")
+
+    def __init__(self, caller, callee, size, jumps):
+        self.caller = caller
+        self.callee = callee
+        self.sites = 0 # calls inlined
+        self.size = size # instructions of the callee
+        self.jumps = jumps # jumps each inlined copy gets for the returns from the middle of the callee
+
+    def __repr__(self):
+        return f"Inlined({self.callee} into {self.caller} x{self.sites})"
+
+    def saved(self) -> int:
+        """
+        Returns the fewest instructions inlining saves when each of the inlined calls runs once: the
+        call and the return it ran, less the jump a return from the middle of the callee became, for a
+        callee that has one. The copies of the arguments and of the result are left to copy propagation.
+        """
+        return self.sites * (2 - min(self.jumps, 1))
+
+    def report(self) -> str:
+        """
+        Returns a line saying what was inlined, the code added, and the instructions saved (see saved).
+        """
+        sites = f"{self.sites} call" + ("s" if self.sites > 1 else "")
+        runs = "per run of the call" if self.sites == 1 else f"when each of the {self.sites} calls runs once"
+        return f"inlined @{self.callee} into @{self.caller} at {sites}: +{self.sites * self.size} instructions, saves at least {self.saved()} {runs}"
+
+def call_graph(funcs) -> dict[str, list[str]]:
+    """
+    Returns the names of the functions each of `funcs` calls, by its name.
+    """
+    return {func.name : list(dict.fromkeys(instr.funcs[0] for instr in func.instrs if isinstance(instr, Instr) and instr.op == "call"))
+            for func in funcs}
+
+def strongly_connected(graph) -> list[list[str]]:
+    """
+    Returns the strongly connected components of the call graph `graph`, each a function and all those
+    it calls that call it back, by Tarjan's algorithm. A component comes after every one it calls into.
+    """
+    index, low, stack, on_stack, components = {}, {}, [], set(), []
+    for root in graph:
+        if root in index: continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            name, callees = work[-1]
+            callee = next(callees, None)
+            if callee is not None:
+                if callee not in index and callee in graph:
+                    index[callee] = low[callee] = len(index)
+                    stack.append(callee)
+                    on_stack.add(callee)
+                    work.append((callee, iter(graph[callee])))
+                elif callee in on_stack:
+                    low[name] = min(low[name], index[callee])
+                continue
+            work.pop()
+            if work: low[work[-1][0]] = min(low[work[-1][0]], low[name])
+            if low[name] == index[name]:
+                component = []
+                while not component or component[-1] != name:
+                    component.append(stack.pop())
+                    on_stack.discard(component[-1])
+                components.append(component)
+    return components
+
+def inline_call(call, callee, base) -> list[Instr | Label]:
+    """
+    Returns the instructions replacing `call` by the body of `callee`, its variables and labels renamed
+    to start with `base` followed by a dot, and ending at the label `base`.
+    """
+    rename = lambda name: f"{base}.{name}"
+    instrs = [Instr("id", rename(arg["name"]), arg["type"], [value]) for arg, value in zip(callee.args, call.args or ())]
+    for instr in callee.instrs:
+        if isinstance(instr, Label):
+            instrs.append(Label(rename(instr.name)))
+        elif instr.op == "ret":
+            if call.dest is not None and instr.args:
+                instrs.append(Instr("id", call.dest, call.type, [rename(instr.args[0])]))
+            instrs.append(Instr("jmp", labels=[base]))
+        else:
+            instrs.append(Instr(instr.op, instr.dest and rename(instr.dest), instr.type, instr.args and [rename(arg) for arg in instr.args],
+                                instr.funcs and list(instr.funcs), instr.labels and [rename(label) for label in instr.labels], instr.value))
+    last = callee.instrs[-1] if callee.instrs else None
+    if isinstance(last, Instr) and last.op == "ret":
+        instrs.pop() # the jump the return at the end of the body became falls through to base
+    instrs.append(Label(base))
+    return instrs
+
+def inline_functions(funcs, max_size=INLINE_SIZE) -> list[Inlined]:
+    """
+    Inlines in `funcs` every call to a function of at most `max_size` instructions that is not
+    recursive. Callees are done before their callers, so what a function calls is inlined into it
+    before it is itself measured and inlined. Returns what was inlined, by caller and callee.
+    """
+    by_name = {func.name : func for func in funcs}
+    graph = call_graph(funcs)
+    components = strongly_connected(graph)
+    recursive = {name for component in components for name in component if len(component) > 1 or name in graph[name]}
+    sizes = {}
+    inlined = []
+    for component in components:
+        for name in component:
+            func = by_name[name]
+            taken = {var for instr in func.instrs for var in ([instr.name] if isinstance(instr, Label) else [instr.dest, *(instr.args or ())])}
+            taken |= {var[:i] for var in taken if var for i, char in enumerate(var) if char == "."} # so no name starts with a base
+            done = {} # callee -> its Inlined
+            instrs = []
+            for instr in func.instrs:
+                callee = by_name.get(instr.funcs[0]) if isinstance(instr, Instr) and instr.op == "call" else None
+                if callee is None or callee.name in recursive or sizes[callee.name] > max_size:
+                    instrs.append(instr)
+                    continue
+                n = 1
+                while f"{callee.name}.{n}" in taken: n += 1
+                taken.add(f"{callee.name}.{n}")
+                instrs += inline_call(instr, callee, f"{callee.name}.{n}")
+                if callee.name not in done:
+                    rets = [code for code in callee.instrs if isinstance(code, Instr) and code.op == "ret"]
+                    jumps = len(rets) - (bool(rets) and rets[-1] is callee.instrs[-1]) # see inline_call
+                    done[callee.name] = Inlined(name, callee.name, sizes[callee.name], jumps)
+                    inlined.append(done[callee.name])
+                done[callee.name].sites += 1
+            func.instrs = instrs
+            sizes[name] = sum(isinstance(instr, Instr) for instr in instrs)
+    return inlined
+
+PASSES = {"copyprop" : copy_propagation, "lvn" : local_value_numbering, "dce" : dead_code_elimination, "ssa" : to_ssa, "from_ssa" : from_ssa, "licm" : loop_invariant_code_motion, "sr" : strength_reduction, "tce" : tail_call_elimination, "cfg" : simplify_cfg}
+PIPELINE = [copy_propagation, tail_call_elimination, local_value_numbering, strength_reduction, copy_propagation, dead_code_elimination, loop_invariant_code_motion,
+            simplify_cfg]
+
+def optimize(func, passes=PIPELINE):
+    for opt_pass in passes:
+        opt_pass(func)
+
+def optimize_bril(program, passes=PIPELINE, inlined=None) -> dict:
+    """
+    Optimizes every function of `program`, Bril JSON, and returns the optimized program. If `inlined`
+    is a list, calls are inlined first (see inline_functions) and what was inlined is added to it.
+    """
+    funcs = [Function.from_bril(func) for func in program["functions"]]
+    if inlined is not None:
+        inlined += inline_functions(funcs)
+    for func in funcs:
+        optimize(func, passes)
+    return {**program, "functions" : [func.to_bril() for func in funcs]}
+
+if __name__ == "__main__":
+    # usage: opt.py [pass...] [inline] < program.json, with passes named as in PASSES (default: inline,
+    # then PIPELINE); the inlining report goes to stderr
+    names = [name for name in sys.argv[1:] if name != "inline"]
+    unknown = [name for name in names if name not in PASSES]
+    if unknown:
+        sys.exit(f"usage: opt.py [pass...] [inline] < program.json, with passes among {', '.join(PASSES)}; not {unknown[0]!r}")
+    passes = [PASSES[name] for name in names] or PIPELINE
+    inlined = [] if "inline" in sys.argv or not names else None
+    json.dump(optimize_bril(json.load(sys.stdin), passes, inlined), sys.stdout, indent=4)
+    for record in inlined or ():
+        print(record.report(), file=sys.stderr)
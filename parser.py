@@ -1,18 +1,42 @@
 import sys
 import json
+import textwrap
+import opt
 import myast
+import astcache
 from lexer import *
 
+EXPR_FRAME, UNARY_FRAME, PAREN_FRAME, CALL_FRAME = range(4) # get_expr's explicit stack frames
+OPS = [myast.Op.__members__.get(name) for name in Kind.NAMES] # operator of each token kind, indexed by code
+
 class Parser(object):
 
     def __init__(self, tokens):
+        if not isinstance(tokens, TokenStream): tokens = TokenStream.from_tokens(tokens)
         self.tokens = tokens
+        self.kinds = tokens.kinds # parallel arrays of the token stream, read directly by the matches_* helpers
+        self.values = tokens.values
         self.size = len(tokens)
         self.pos = 0
+        self.def_line = 0 # line of the 'def' being parsed, which node positions are relative to
 
     def error(self, msg=""):
         if msg: msg = f": {msg}"
-        raise Exception(f"Syntax error{msg}")
+        where = ""
+        if self.pos < self.size and self.tokens.lines[self.pos]:
+            line, col, _ = self.tokens.position(self.pos)
+            where = f" at line {line}, column {col}"
+        elif self.pos >= self.size:
+            where = " at end of input"
+        raise Exception(f"Syntax error{where}{msg}")
+
+    def node_position(self, i) -> tuple[int, int]:
+        """
+        Returns the position of the `i`th token as stored in AST nodes: the line relative to the
+        enclosing 'def' (see myast.Expr), and the column.
+        """
+        line = self.tokens.lines[i]
+        return line and line - self.def_line, self.tokens.cols[i]
 
     def token(self, peek_amt=0) -> Token | None:
         """
@@ -25,6 +49,16 @@ class Parser(object):
         else:
             return None
 
+    def kind(self, peek_amt=0) -> int | None:
+        """
+        Returns the Kind code of the token `peek_amt` away from the
+        current one, or None if it doesn't exist.
+        """
+        if self.pos + peek_amt < self.size:
+            return self.kinds[self.pos + peek_amt]
+        else:
+            return None
+
     def advance(self):
         """
         Advance to the next token if it exists.
@@ -36,64 +70,64 @@ class Parser(object):
         """
         Returns true if there are still tokens left to match.
         """
-        return self.token() is not None
+        return self.pos < self.size
 
     def matches_newline(self) -> bool:
-        return self.not_done() and self.token().matches("NEWLINE")
+        return self.kind() == Kind.NEWLINE
 
     def matches_indent(self) -> bool:
-        return self.not_done() and self.token().matches("INDENT")
+        return self.kind() == Kind.INDENT
 
     def matches_dedent(self) -> bool:
-        return self.not_done() and self.token().matches("DEDENT")
+        return self.kind() == Kind.DEDENT
 
     def matches_keyword(self, word) -> bool:
         """
         Returns true if current token type is KEYWORD, AND the keyword value itself matches `word`.
         """
-        return self.not_done() and self.token().matches(Token.KEYWORD) and self.token().value == word
+        return self.kind() == Kind.KEYWORD and self.values[self.pos] == word
 
     def matches_typed_var(self) -> bool:
         """
         Returns true if current tokens match: 'typed_var ::= ID : type'
         """
-        return self.not_done() and self.token().matches(Token.ID) and self.token(1).matches(Token.COLON)
+        return self.kind() == Kind.ID and self.kind(1) == Kind.COLON
 
     def matches_func_def(self) -> bool:
         """
         Returns true if current tokens match prefix of: 'func_def ::= def ID ({typed_var {, typed_var}*}?) { -> type}? NEWLINE INDENT func_body DEDENT'
         """
-        return self.not_done() and self.matches_keyword("def") and self.token(1).matches(Token.ID)
+        return self.matches_keyword("def") and self.kind(1) == Kind.ID
 
     def matches_num(self) -> bool:
         """
         Returns true if current token is NUM.
         """
-        return self.not_done() and self.token().matches(Token.NUM)
+        return self.kind() == Kind.NUM
 
     def matches_bool(self) -> bool:
         """
         Returns true if current token is BOOL.
         """
-        return self.not_done() and self.token().matches(Token.BOOL)
+        return self.kind() == Kind.BOOL
 
     def matches_literal(self) -> bool:
         """
         Returns true if current token is a literal: a NUM or a BOOL.
         """
-        return self.matches_num() or self.matches_bool()
+        return self.kind() in (Kind.NUM, Kind.BOOL)
 
     def matches_id(self) -> bool:
         """
         Returns true if current token is ID
         """
-        return self.not_done() and self.token().matches(Token.ID)
+        return self.kind() == Kind.ID
 
     def matches_type(self) -> bool:
         """
         Returns true if current token is TYPE
         """
-        return self.not_done() and self.token().matches(Token.TYPE)
+        return self.kind() == Kind.TYPE
 
     def matches_pass_stmt(self) -> bool:
         return self.matches_keyword("pass")
@@ -114,127 +148,173 @@ class Parser(object):
         return self.matches_keyword("for")
 
     def matches_assign_stmt(self) -> bool:
-        return self.matches_id() and self.token(1).matches(Token.ASSIGN)
+        return self.kind() == Kind.ID and self.kind(1) == Kind.ASSIGN
 
     def matches_call_expr(self):
-        return self.matches_id() and self.token(1).matches(Token.LPAREN)
+        return self.kind() == Kind.ID and self.kind(1) == Kind.LPAREN
 
-    def match(self, token) -> Token:
+    def match(self, kind):
         """
-        If the current token has the same "name" (e.g. "LPAREN", "COMMA", "TYPE", etc.)
-        as `token`, then we advance to the next token. Otherwise an error is raised.
+        If the current token has kind `kind` (a Kind code, e.g. Kind.LPAREN, Kind.COMMA, Kind.TYPE, etc.),
+        then we advance to the next token and return its value. Otherwise an error is raised.
         """
-        matchee = self.token()
-        if matchee.matches(token): self.advance()
-        else: self.error(f"{token} does not match current token {matchee}")
-        return matchee
+        if self.kind() != kind:
+            self.error(f"{Kind.NAMES[kind]} does not match current token {self.token()}")
+        value = self.values[self.pos]
+        self.pos += 1
+        return value
 
     def match_newline(self):
-        self.match("NEWLINE")
+        self.match(Kind.NEWLINE)
 
     def match_indent(self):
-        self.match("INDENT")
+        self.match(Kind.INDENT)
 
     def match_dedent(self):
-        self.match("DEDENT")
+        self.match(Kind.DEDENT)
 
     def match_keyword(self, word):
-        assert self.matches_keyword(word)
-        self.match(Token.KEYWORD)
+        if not self.matches_keyword(word):
+            self.error(f"'{word}' does not match current token {self.token()}")
+        self.pos += 1
 
     def get_pass_stmt(self) -> myast.PassStmt:
-        assert self.matches_pass_stmt()
         self.match_keyword("pass")
         return myast.PassStmt()
 
     def get_print_stmt(self) -> myast.PrintStmt:
-        assert self.matches_print_stmt()
         self.match_keyword("print")
-        self.match(Token.LPAREN)
+        self.match(Kind.LPAREN)
         expr = self.get_expr()
-        self.match(Token.RPAREN)
+        self.match(Kind.RPAREN)
         return myast.PrintStmt(expr)
 
     def get_return_stmt(self) -> myast.ReturnStmt:
-        assert self.matches_return_stmt()
         self.match_keyword("return")
         expr = self.get_expr()
         return myast.ReturnStmt(expr)
 
     def get_assign_stmt(self) -> myast.AssignStmt:
         assert self.matches_assign_stmt()
+        line, col = self.node_position(self.pos)
         dest = self.get_id()
-        self.match(Token.ASSIGN)
+        self.match(Kind.ASSIGN)
         expr = self.get_expr()
-        return myast.AssignStmt(dest, expr)
+        return myast.AssignStmt(dest, expr, line, col)
 
     def get_expr_stmt(self) -> myast.ExprStmt:
         expr = self.get_expr()
         return myast.ExprStmt(expr)
 
-    def get_call_expr(self) -> myast.CallExpr:
-        assert self.matches_call_expr()
-        name = self.get_id()
-        args = []
-        self.match(Token.LPAREN)
-        if not self.token().matches(Token.RPAREN):
-            args.append(self.get_expr())
-            while self.token().matches(Token.COMMA):
-                self.match(Token.COMMA)
-                args.append(self.get_expr())
-        self.match(Token.RPAREN)
-        return myast.CallExpr(name, args)
-
-    def get_atom(self, min_prec=1) -> myast.Expr:
-        if self.matches_call_expr():
-            return self.get_call_expr()
-        elif self.token().matches(Token.LPAREN):
-            self.match(Token.LPAREN)
-            expr = self.get_expr()
-            self.match(Token.RPAREN)
-            return expr
-        elif self.token().matches(Token.NOT) or self.token().matches(Token.SUB):
-            op = self.token().name
-            self.advance()
-            expr = self.get_expr()
-            return myast.UnOpExpr(op, expr)
-        elif self.matches_literal():
-            return self.get_literal()
-        elif self.matches_id():
-            return self.get_id_expr()
-        else:
-            self.error()
-
     def get_expr(self, min_prec=1) -> myast.Expr:
-        lhs = self.get_atom()
-        while self.not_done() and Token.get_precedence(self.token().name) >= min_prec:
-            op = self.token().name
-            prec = Token.get_precedence(op)
-            self.advance()
-            lhs = myast.BinOpExpr(op, lhs, self.get_expr(prec+1))
-        return lhs
+        """
+        Parses an expression by precedence climbing, binding operators of precedence >= `min_prec`.
+        Operands that contain a nested expression (calls, parentheses, 'not' and unary '-') are
+        tracked on an explicit stack of frames instead of by recursion, so nesting depth is only
+        limited by memory:
+
+            [EXPR_FRAME, min_prec, lhs, op, at]  an operator chain; `op`, the token at index `at`,
+                                                 awaits its right operand, which is itself an
+                                                 EXPR_FRAME binding tighter than `op`
+            [UNARY_FRAME, op, at]                'not'/'-' awaiting its operand, a whole expression
+            [PAREN_FRAME]                        '(' awaiting its expression and ')'
+            [CALL_FRAME, name, args, at]         a call awaiting its next argument
+
+        Each node is given the line and column of its token: the operator for operations, the
+        first token otherwise.
+        """
+        kinds, values, precedence = self.kinds, self.values, Kind.PRECEDENCE
+        position = self.node_position
+        stack = [[EXPR_FRAME, min_prec, None, None, 0]]
+        while True:
+
+            # parse an atom, or push the frames for one that contains a nested expression
+            kind = self.kind()
+            at = self.pos
+            if kind == Kind.ID:
+                if self.kind(1) == Kind.LPAREN:
+                    name = values[at]
+                    self.pos += 2
+                    if self.kind() == Kind.RPAREN:
+                        self.pos += 1
+                        value = myast.CallExpr(name, [], *position(at))
+                    else:
+                        stack.append([CALL_FRAME, name, [], at])
+                        stack.append([EXPR_FRAME, 1, None, None, 0])
+                        continue
+                else:
+                    value = myast.IdExpr(values[at], *position(at))
+                    self.pos += 1
+            elif kind == Kind.NUM:
+                value = myast.Literal(values[at], "int", *position(at))
+                self.pos += 1
+            elif kind == Kind.BOOL:
+                value = myast.Literal(values[at], "bool", *position(at))
+                self.pos += 1
+            elif kind == Kind.LPAREN:
+                self.pos += 1
+                stack.append([PAREN_FRAME])
+                stack.append([EXPR_FRAME, 1, None, None, 0])
+                continue
+            elif kind == Kind.NOT or kind == Kind.SUB:
+                self.pos += 1
+                stack.append([UNARY_FRAME, OPS[kind], at])
+                stack.append([EXPR_FRAME, 1, None, None, 0])
+                continue
+            else:
+                self.error()
+
+            # hand the finished operand up the stack until some frame needs another atom
+            while True:
+                frame = stack[-1]
+                tag = frame[0]
+                if tag == EXPR_FRAME:
+                    if frame[3] is not None: value = myast.BinOpExpr(frame[3], frame[2], value, *position(frame[4]))
+                    if self.pos < self.size and precedence[kinds[self.pos]] >= frame[1]:
+                        kind = kinds[self.pos]
+                        frame[2], frame[3], frame[4] = value, OPS[kind], self.pos
+                        self.pos += 1
+                        stack.append([EXPR_FRAME, precedence[kind] + 1, None, None, 0])
+                        break
+                    stack.pop()
+                    if not stack: return value
+                elif tag == UNARY_FRAME:
+                    stack.pop()
+                    value = myast.UnOpExpr(frame[1], value, *position(frame[2]))
+                elif tag == PAREN_FRAME:
+                    self.match(Kind.RPAREN)
+                    stack.pop()
+                else:
+                    frame[2].append(value)
+                    if self.kind() == Kind.COMMA:
+                        self.pos += 1
+                        stack.append([EXPR_FRAME, 1, None, None, 0])
+                        break
+                    self.match(Kind.RPAREN)
+                    stack.pop()
+                    value = myast.CallExpr(frame[1], frame[2], *position(frame[3]))
 
     def get_id(self) -> str:
         """
         Parses an identifier into a string.
         """
         assert self.matches_id()
-        return self.match(Token.ID).value
+        return self.match(Kind.ID)
 
     def get_type(self) -> str:
         """
         Parses a type into one of the following strings: "int" or "bool"
         """
         assert self.matches_type()
-        return self.match(Token.TYPE).value
+        return self.match(Kind.TYPE)
 
     def get_num(self) -> int:
         assert self.matches_num()
-        return self.match(Token.NUM).value
+        return self.match(Kind.NUM)
 
     def get_bool(self) -> str:
         assert self.matches_bool()
-        return self.match(Token.BOOL).value
+        return self.match(Kind.BOOL)
 
     def get_literal(self) -> myast.Literal:
         """
@@ -259,7 +339,7 @@ class Parser(object):
         """
         assert self.matches_typed_var()
         name = self.get_id()
-        self.match(Token.COLON)
+        self.match(Kind.COLON)
         type = self.get_type()
         return myast.TypedVar(name, type)
 
@@ -268,11 +348,12 @@ class Parser(object):
         Parses a variable definition into a myast.VarDef object.
         """
         assert self.matches_typed_var()
+        line, col = self.node_position(self.pos)
         typed_var = self.get_typed_var()
-        self.match(Token.ASSIGN)
+        self.match(Kind.ASSIGN)
         literal = self.get_literal()
         self.match_newline()
-        return myast.VarDef(typed_var, literal)
+        return myast.VarDef(typed_var, literal, line, col)
 
     def get_block(self) -> list[myast.Stmt]:
         self.match_newline()
@@ -288,67 +369,58 @@ class Parser(object):
         iter_name = self.get_id()
         self.match_keyword("in")
         self.match_keyword("range")
-        self.match(Token.LPAREN)
+        self.match(Kind.LPAREN)
         bounds = [self.get_num()]
-        if self.token().matches(Token.COMMA):
-            self.match(Token.COMMA)
+        if self.kind() == Kind.COMMA:
+            self.match(Kind.COMMA)
             bounds.append(self.get_num())
-        self.match(Token.RPAREN)
-        self.match(Token.COLON)
+        self.match(Kind.RPAREN)
+        self.match(Kind.COLON)
         block = self.get_block()
         return myast.ForStmt(iter_name, bounds, block)
 
     def get_while_stmt(self) -> myast.WhileStmt:
         self.match_keyword("while")
         cond = self.get_expr()
-        self.match(Token.COLON)
+        self.match(Kind.COLON)
         block = self.get_block()
         return myast.WhileStmt(cond, block)
 
     def get_if_stmt(self) -> myast.IfStmt:
         self.match_keyword("if")
         cond = self.get_expr()
-        self.match(Token.COLON)
+        self.match(Kind.COLON)
         if_block = self.get_block()
         elif_blocks = []
         else_block = None
         while self.matches_keyword("elif"):
             self.match_keyword("elif")
             lcond = self.get_expr()
-            self.match(Token.COLON)
+            self.match(Kind.COLON)
             lblock = self.get_block()
             elif_blocks.append((lcond, lblock))
         if self.matches_keyword("else"):
             self.match_keyword("else")
-            self.match(Token.COLON)
+            self.match(Kind.COLON)
             else_block = self.get_block()
         return myast.IfStmt(cond, if_block, elif_blocks, else_block)
 
     def get_stmt(self) -> myast.Stmt:
-        if self.matches_while_stmt():
-            return self.get_while_stmt()
-        elif self.matches_for_stmt():
-            return self.get_for_stmt()
-        elif self.matches_if_stmt():
-            return self.get_if_stmt()
-        else:
-            stmt = self.get_simple_stmt()
-            self.match_newline()
-            return stmt
+        if self.kind() == Kind.KEYWORD:
+            method = self.COMPOUND_STMT_TABLE.get(self.values[self.pos])
+            if method: return method(self)
+        stmt = self.get_simple_stmt()
+        self.match(Kind.NEWLINE)
+        return stmt
 
     def get_simple_stmt(self) -> myast.Stmt:
-        if self.matches_while_stmt():
-            return self.get_while_stmt()
-        if self.matches_pass_stmt():
-            return self.get_pass_stmt()
-        elif self.matches_print_stmt():
-            return self.get_print_stmt()
-        elif self.matches_return_stmt():
-            return self.get_return_stmt()
-        elif self.matches_assign_stmt():
+        kind = self.kind()
+        if kind == Kind.KEYWORD:
+            method = self.SIMPLE_STMT_TABLE.get(self.values[self.pos])
+            if method: return method(self)
+        elif kind == Kind.ID and self.kind(1) == Kind.ASSIGN:
             return self.get_assign_stmt()
-        else:
-            return self.get_expr_stmt()
+        return self.get_expr_stmt()
 
     def get_func_body(self) -> myast.FuncBody:
         """
@@ -384,37 +456,38 @@ class Parser(object):
         """
         Parse function identifier (required)
         """
+        self.def_line = self.tokens.lines[self.pos]
         self.match_keyword("def")
         name = self.get_id()
-        self.match(Token.LPAREN)
+        self.match(Kind.LPAREN)
 
         """
         Parse function parameters (defaults to no parameters)
         """
         if self.matches_typed_var():
             params.append(self.get_typed_var())
-            while self.token().matches(Token.COMMA):
-                self.match(Token.COMMA)
+            while self.kind() == Kind.COMMA:
+                self.match(Kind.COMMA)
                 params.append(self.get_typed_var())
-        self.match(Token.RPAREN)
+        self.match(Kind.RPAREN)
 
         """
         Parse function return type (defaults to no return type)
         """
-        if self.token().matches(Token.ARROW):
-            self.match(Token.ARROW)
+        if self.kind() == Kind.ARROW:
+            self.match(Kind.ARROW)
             type = self.get_type()
 
         """
         Parse function body (required)
         """
-        self.match(Token.COLON)
+        self.match(Kind.COLON)
         self.match_newline()
         self.match_indent()
         body = self.get_func_body()
         self.match_dedent()
 
-        return myast.FuncDef(name, params, type, body)
+        return myast.FuncDef(name, params, type, body, self.def_line)
 
     def get_func_defs(self) -> list[myast.FuncDef]:
         """
@@ -431,8 +504,121 @@ class Parser(object):
         func_defs = self.get_func_defs()
         return myast.Program(func_defs)
 
+    """
+    Dispatch tables, so that statements are parsed by looking up the current keyword once
+    instead of trying each matches_* helper in turn.
+    """
+    COMPOUND_STMT_TABLE = {"while" : get_while_stmt, "for" : get_for_stmt, "if" : get_if_stmt}
+    SIMPLE_STMT_TABLE = {"while" : get_while_stmt, "pass" : get_pass_stmt, "print" : get_print_stmt, "return" : get_return_stmt}
+
+def scan_func_types(source) -> dict[str, str]:
+    """
+    Cheap pre-scan for the return types of the top-level functions in `source`, as Program.get_bril
+    collects them, read from the 'def' lines alone without lexing or parsing any function body.
+    """
+    func_types = {}
+    for line in source_lines(source):
+        if line.startswith("#!#"):
+            break
+        if not is_top_level(line):
+            continue
+        tokens = [(name, value) for name, value, _ in Token.scan(line)]
+        if len(tokens) < 2 or tokens[0] != ("KEYWORD", "def") or tokens[1][0] != "ID":
+            continue
+        type = None
+        for (name, _), (next_name, next_value) in zip(tokens, tokens[1:]):
+            if name == "ARROW" and next_name == "TYPE":
+                type = next_value
+        func_types[tokens[1][1]] = type
+    return func_types
+
+def iter_func_defs(source):
+    """
+    Parses the top-level functions of `source` one chunk (see lexer.source_chunks) at a time, so only
+    one function's tokens and AST are held at once. Yields the same FuncDefs as get_program would.
+    """
+    def parse(tokens, lookahead):
+        # the first token of the next chunk is appended so errors at the end of this chunk
+        # are reported as parsing the whole source would report them
+        size = len(tokens)
+        if lookahead is not None: tokens.append(*next(lookahead.items()))
+        parser = Parser(tokens)
+        return parser.get_func_defs(), parser.pos < size
+
+    previous = None
+    for text, lineno, offset in source_chunks(source):
+        if text.startswith("#!#"):
+            break
+        tokens = TokenStream.from_text(text, lineno, offset)
+        if previous is not None:
+            func_defs, stop = parse(previous, tokens)
+            yield from func_defs
+            if stop: return
+        previous = tokens
+    if previous is not None:
+        func_defs, _ = parse(previous, None)
+        yield from func_defs
+
+def compile_stream(source, out, fold=True, passes=(), unrolling=None):
+    """
+    Compiles `source` to Bril, writing each function's JSON to `out` as soon as it is generated. The
+    text written is the same as json.dump(program.get_bril(fold, passes, None, unrolling), out, indent=4). Function types come from
+    scan_func_types, so `source` is read twice and must be a string, an mmap or a seekable file.
+    """
+    func_types = scan_func_types(source)
+    if not isinstance(source, str): source.seek(0)
+    sep = "\n"
+    out.write('{\n    "functions": [')
+    for func_def in iter_func_defs(source):
+        myast.Program([func_def]).check_types(func_types)
+        out.write(sep + textwrap.indent(json.dumps(func_def.get_bril(fold, passes, unrolling), indent=4), " " * 8))
+        sep = ",\n"
+    out.write("]\n}" if sep == "\n" else "\n    ]\n}")
+
+def get_cached_program(source, cache) -> myast.Program:
+    """
+    Returns the program of `source` (a string or an mmap) from `cache`, lexing and parsing it, and
+    storing the result, only if the cache has no usable entry for it.
+    """
+    key = cache.key(source.encode() if isinstance(source, str) else source)
+    program = cache.load(key)
+    if program is None:
+        program = Parser(TokenStream.from_text(source)).get_program()
+        cache.store(key, program)
+    return program
+
 if __name__ == "__main__":
-    tokens = list(lex_text(sys.stdin.read()))
-    parser = Parser(tokens)
-    program = parser.get_program()
-    json.dump(program.get_bril(), sys.stdout, indent=4)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("-")]
+    source = open_source(args[0]) if args else None
+    fold = "--no-fold" not in sys.argv # see myast.Expr.fold
+    passes = opt.PIPELINE if "--opt" in sys.argv else () # see opt.py
+    inlined = [] if "--opt" in sys.argv else None # --opt inlines calls too, but not with --stream
+    unrolling = None # --opt unrolls for loops too, as does --unroll=N, by N (see myast.Unrolling)
+    factors = [arg[len("--unroll="):] for arg in sys.argv if arg.startswith("--unroll=")]
+    if factors:
+        if not (factors[-1].isascii() and factors[-1].isdecimal()) or int(factors[-1]) < 1:
+            sys.exit(f"usage: --unroll=N takes a whole number of at least 1, not {factors[-1]!r}")
+        unrolling = myast.Unrolling(int(factors[-1]))
+    elif "--opt" in sys.argv:
+        unrolling = myast.Unrolling()
+    if "--stream" in sys.argv: # compile one function at a time
+        if not args: source = sys.stdin if sys.stdin.seekable() else sys.stdin.read()
+        compile_stream(source, sys.stdout, fold, passes, unrolling)
+        program = None
+    elif "--cache" in sys.argv: # reuse the AST of an unchanged source, see astcache.py
+        program = get_cached_program(source if args else sys.stdin.read(), astcache.AstCache())
+    else:
+        if "--binary" in sys.argv: # input is a token stream written by `lexer.py --binary`
+            tokens = TokenStream.from_binary(source if args else sys.stdin.buffer.read())
+        else:
+            tokens = TokenStream.from_text(source if args else sys.stdin)
+        parser = Parser(tokens)
+        program = parser.get_program()
+    if program is not None:
+        json.dump(program.get_bril(fold, passes, inlined, unrolling), sys.stdout, indent=4)
+    if "--inline-report" in sys.argv:
+        for record in inlined or ():
+            print(record.report(), file=sys.stderr)
+    if "--unroll-report" in sys.argv:
+        for record in unrolling.loops.values() if unrolling else ():
+            print(record.report(), file=sys.stderr)
@@ -0,0 +1,44 @@
+import io
+import os
+import json
+import unittest
+import contextlib
+from lexer import TokenStream, dump_binary, lex_positions, lexer_main
+
+"""
+Round trip of the binary token-stream format against the JSON token dump, on every example program.
+Run with `python -m unittest test_lexer` or pytest.
+"""
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
+
+def example_paths() -> list[str]:
+    return sorted(os.path.join(EXAMPLES, name) for name in os.listdir(EXAMPLES) if name.endswith(".py"))
+
+class BinaryRoundTripTest(unittest.TestCase):
+
+    def test_examples(self):
+        paths = example_paths()
+        self.assertTrue(paths)
+        for path in paths:
+            with self.subTest(path=os.path.basename(path)):
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out):
+                    lexer_main(path=path)
+                expected = json.loads(out.getvalue())
+
+                data = io.BytesIO()
+                with open(path) as source:
+                    dump_binary(lex_positions(source), data)
+                stream = TokenStream.from_binary(data.getvalue())
+                self.assertEqual([token.to_dict() for token in stream], expected)
+
+                with open(path) as source:
+                    self.assertEqual(list(stream.items()), list(TokenStream.from_text(source).items()))
+
+    def test_rejects_other_data(self):
+        with self.assertRaises(Exception):
+            TokenStream.from_binary(b"[]")
+
+if __name__ == "__main__":
+    unittest.main()